@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Timelines of the AMR workload of cases.
+
+For every frame and every level, the numbers of patches and cells and the
+fraction of the domain covered by the level are taken from the frame index
+(see frameindex.py); no q or aux data are read. The workload is compared with
+the uniform grid at the resolution of the finest level:
+
+    cells_ratio: cells on all levels / cells of the uniform fine grid
+    work_ratio: cell updates per level-1 time step on all levels / those of the
+        uniform fine grid, where level l takes the product of the time
+        refinement ratios up to l steps per level-1 step
+
+The timeline of a case goes to amr_timeline.store in the case folder (see
+diagstore.py), and a figure comparing the cases goes to figs/amr_timeline.png.
+"""
+import os
+import sys
+import logging
+import caseinfo
+import frameindex
+import diagstore
+
+
+# logger
+logger = logging.getLogger("amrtimeline.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_amrtimeline.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+
+def get_timeline(casepath):
+    """Get the AMR workload timeline of a case.
+
+    Returns a dict of column name -> 1D array, with columns frame, t,
+    npatches_level<l>, cells_level<l>, area_fraction_level<l>, cells_ratio, and
+    work_ratio.
+    """
+    import numpy
+
+    info = caseinfo.get_case_info(casepath)
+    index = frameindex.load_index(os.path.join(os.path.abspath(casepath), "_output"))
+    nlevels = info["nlevels"]
+
+    domain_area = (info["upper"][0]-info["lower"][0]) * (info["upper"][1]-info["lower"][1])
+
+    # time steps per level-1 step and cells of the uniform fine grid
+    steps = numpy.cumprod([1] + [rt for _, _, rt in info["refinement_ratios"]])
+    uniform_cells = info["cells"][-1]
+
+    frames = index.frames["frame"]
+    patches = index.patches
+
+    # frame and level of each patch as row and column of the tables
+    rows = numpy.searchsorted(frames, patches["frame"])
+    cols = patches["level"] - 1
+    valid = cols < nlevels
+    rows, cols = rows[valid], cols[valid]
+    cells = patches["mx"][valid].astype(numpy.int64) * patches["my"][valid]
+    areas = cells * patches["dx"][valid] * patches["dy"][valid]
+
+    npatches = numpy.zeros((len(frames), nlevels), dtype=numpy.int64)
+    ncells = numpy.zeros((len(frames), nlevels), dtype=numpy.int64)
+    area = numpy.zeros((len(frames), nlevels), dtype=numpy.float64)
+    numpy.add.at(npatches, (rows, cols), 1)
+    numpy.add.at(ncells, (rows, cols), cells)
+    numpy.add.at(area, (rows, cols), areas)
+
+    timeline = {"frame": frames, "t": index.frames["t"]}
+    for lvl in range(1, nlevels+1):
+        timeline["npatches_level{}".format(lvl)] = npatches[:, lvl-1]
+        timeline["cells_level{}".format(lvl)] = ncells[:, lvl-1]
+        timeline["area_fraction_level{}".format(lvl)] = area[:, lvl-1] / domain_area
+    timeline["cells_ratio"] = ncells.sum(axis=1) / uniform_cells
+    timeline["work_ratio"] = ncells.dot(steps) / (uniform_cells * steps[-1])
+
+    return timeline
+
+def create_timeline_store(casepath):
+    """Write the AMR workload timeline of a case to amr_timeline.store."""
+
+    timeline = get_timeline(casepath)
+    columns = [(name, values.dtype.str) for name, values in timeline.items()]
+    diagstore.write_store(
+        os.path.join(os.path.abspath(casepath), "amr_timeline.store"), columns, timeline)
+
+    logger.info(
+        "%s: mean cells ratio %.3f, mean work ratio %.3f, max refined fraction %.3f",
+        casepath, timeline["cells_ratio"].mean(), timeline["work_ratio"].mean(),
+        max([timeline[name].max() for name in timeline if name.startswith("area_fraction")
+             and not name.endswith("level1")] + [0.]))
+
+    return timeline
+
+def plot_timelines(timelines, savepath):
+    """Plot refined-area fractions and work ratios of cases against time.
+
+    `timelines` is a dict of label -> timeline from `get_timeline`.
+    """
+    from matplotlib import pyplot
+
+    fig, axes = pyplot.subplots(2, 1, sharex=True, figsize=(8, 8), dpi=100)
+
+    for label, timeline in timelines.items():
+        finest = max([int(name[len("cells_level"):]) for name in timeline
+                      if name.startswith("cells_level")])
+        axes[0].plot(
+            timeline["t"], timeline["area_fraction_level{}".format(finest)],
+            label="{} (level {})".format(label, finest))
+        axes[1].plot(timeline["t"], timeline["work_ratio"], label=label)
+
+    axes[0].set_ylabel("Fraction of the domain on the finest level")
+    axes[1].set_ylabel("Work / uniform fine grid")
+    axes[1].set_xlabel(r"$Time\ (sec)$")
+    axes[0].set_title("AMR workload v.s. time")
+    for ax in axes:
+        ax.grid()
+    axes[1].legend(
+        loc=9, bbox_to_anchor=(0.5, -0.15), ncol=2, fontsize=10,
+        handlelength=3, columnspacing=1)
+
+    fig.savefig(savepath, dpi=100, bbox_inches="tight")
+    pyplot.close(fig)
+
+    logger.info("Done creating figure %s", savepath)
+
+if __name__ == "__main__":
+    import argparse
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(description="AMR workload timelines of cases.")
+
+    parser.add_argument(
+        '--cases', dest='cases', type=str, nargs="+",
+        default=["amr-tests/original", "amr-tests/fix_update",
+                 "amr-tests/fix_flag2refine2", "amr-tests/fix_update_and_flag2refine2"],
+        help='case folders (default: all AMR cases)')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+    figs_path = os.path.join(repo_path, "figs")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    timelines = {}
+    for case in args.cases:
+        timelines[os.path.basename(os.path.normpath(case))] = create_timeline_store(case)
+
+    if not os.path.isdir(figs_path):
+        os.makedirs(figs_path)
+
+    plot_timelines(timelines, os.path.join(figs_path, "amr_timeline.png"))
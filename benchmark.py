@@ -0,0 +1,221 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Benchmark the solvers in cell updates per second on each AMR level.
+
+Each (solver, case) pair runs in the folder _benchmark/<solver> inside the
+case folder, optionally with a shortened tfinal, so the real outputs in
+_output are not touched. The number of time steps on each level comes from
+the solver's STDOUT, and the number of cells on each level at each step comes
+from the patch sizes in the fort.q headers of the frame preceding the step.
+"""
+import os
+import sys
+import logging
+import caseinfo
+import watchdog
+import frameindex
+
+
+# logger
+logger = logging.getLogger("benchmark.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_benchmark.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+
+def create_benchmark_data(casepath, out_dir, tfinal=None):
+    """Write *.data files of a case, optionally with a shortened tfinal.
+
+    The output interval is kept, so a shorter run writes fewer frames. Every
+    level prints its time steps (verbosity = amr_levels_max), and no
+    checkpoints are written.
+    """
+
+    rundata = caseinfo.load_rundata(casepath)
+    clawdata = rundata.clawdata
+
+    if tfinal is not None and tfinal < clawdata.tfinal:
+        clawdata.num_output_times = max(
+            1, int(round(clawdata.num_output_times*tfinal/clawdata.tfinal)))
+        clawdata.tfinal = tfinal
+
+    clawdata.verbosity = rundata.amrdata.amr_levels_max
+    clawdata.checkpt_style = 0
+    clawdata.restart = False
+
+    rundata.write(out_dir=out_dir)
+
+def count_cell_updates(run_path, nlevels):
+    """Count time steps and cell updates on each level of a finished run.
+
+    Returns two lists (indexed by level-1): time steps and cell updates.
+    """
+    import bisect
+    import numpy
+
+    # times and per-level cell counts of all frames
+    index = frameindex.load_index(run_path)
+    times = list(index.frames["t"])
+    cells = []
+    for fno in index.frames["frame"]:
+        patches = frameindex.get_frame(index, fno)[1]
+        cells.append(numpy.bincount(
+            patches["level"]-1, patches["mx"].astype(numpy.int64)*patches["my"],
+            minlength=nlevels)[:nlevels].astype(numpy.int64).tolist())
+
+    steps, _ = watchdog.read_steps(os.path.join(run_path, "stdout.txt"))
+
+    nsteps = [0] * nlevels
+    updates = [0] * nlevels
+    for level, _, dt, t in steps:
+        if level > nlevels:
+            continue
+
+        # patches of the frame at or before the beginning of this step
+        k = max(0, bisect.bisect_right(times, t-dt) - 1)
+        nsteps[level-1] += 1
+        updates[level-1] += cells[k][level-1]
+
+    return nsteps, updates
+
+def benchmark_case(solver, casepath, tfinal=None, nthreads=None):
+    """Run a case with a solver and return its throughput records.
+
+    Returns a list of dicts, one per level and one for all levels (level 0),
+    with keys solver, case, nthreads, level, steps, cell_updates, walltime,
+    and cell_updates_per_sec.
+    """
+    import shutil
+    import subprocess
+
+    solver = os.path.abspath(solver)
+    casepath = os.path.abspath(casepath)
+    run_path = os.path.join(casepath, "_benchmark", os.path.basename(solver))
+    nlevels = caseinfo.get_case_info(casepath)["nlevels"]
+
+    if os.path.isdir(run_path):
+        shutil.rmtree(run_path)
+    os.makedirs(run_path)
+
+    create_benchmark_data(casepath, run_path, tfinal)
+
+    env = os.environ.copy()
+    if nthreads is not None:
+        env["OMP_NUM_THREADS"] = str(nthreads)
+
+    logger.info("Benchmarking %s with case %s", solver, casepath)
+    with open(os.path.join(run_path, "stdout.txt"), "w") as stdout:
+        job = subprocess.Popen(
+            [solver], stdout=stdout, stderr=subprocess.STDOUT, env=env, cwd=run_path)
+        # no abort criteria, so the wall time is taken right at the solver's exit
+        state = watchdog.watch(job, stdout.name, run_path)
+
+    if job.returncode != 0:
+        logger.error("Benchmark of %s with case %s failed. See %s.",
+                     solver, casepath, stdout.name)
+        raise subprocess.CalledProcessError(job.returncode, solver)
+
+    nsteps, updates = count_cell_updates(run_path, nlevels)
+    walltime = state["walltime"]
+
+    records = []
+    for lvl in range(nlevels+1):
+        record = {
+            "solver": os.path.basename(solver),
+            "case": casepath,
+            "nthreads": nthreads if nthreads is not None else 0,
+            "level": lvl,
+            "steps": sum(nsteps) if lvl == 0 else nsteps[lvl-1],
+            "cell_updates": sum(updates) if lvl == 0 else updates[lvl-1],
+            "walltime": walltime}
+        record["cell_updates_per_sec"] = record["cell_updates"] / walltime
+        records.append(record)
+
+        logger.info("%s, %s, level %s: %d steps, %.3e cell updates, %.3e cell updates/s",
+                    record["solver"], casepath, lvl if lvl else "all", record["steps"],
+                    record["cell_updates"], record["cell_updates_per_sec"])
+
+    return records
+
+def write_records(records, csvfile):
+    """Write benchmark records to a CSV file."""
+
+    keys = ["solver", "case", "nthreads", "level", "steps", "cell_updates",
+            "walltime", "cell_updates_per_sec"]
+
+    with open(csvfile, "w") as f:
+        f.write(",".join(keys) + "\n")
+        for record in records:
+            f.write(",".join([str(record[k]) for k in keys]) + "\n")
+
+    logger.info("Done writing %s", csvfile)
+
+if __name__ == "__main__":
+    import argparse
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(
+        description="Benchmark solvers in cell updates per second.")
+
+    parser.add_argument(
+        '--cases', dest='cases', type=str, nargs="+", default=["amr-tests/original"],
+        help='case folders to run')
+
+    parser.add_argument(
+        '--solvers', dest='solvers', type=str, nargs="+",
+        default=["xgeoclaw.original", "xgeoclaw.update", "xgeoclaw.flag2refine2",
+                 "xgeoclaw.update_and_flag2refine2"],
+        help='executables in bin to benchmark')
+
+    parser.add_argument(
+        '--tfinal', dest='tfinal', type=float, default=None,
+        help='shortened final time of the runs (default: tfinal in setrun.py)')
+
+    parser.add_argument(
+        '--nthreads', dest='nthreads', type=int, default=None,
+        help='OpenMP threads of each run (default: inherited from the environment)')
+
+    parser.add_argument(
+        '--output', dest='output', type=str, default="benchmark.csv",
+        help='CSV file of the results')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    records = []
+    for case in args.cases:
+        for solver in args.solvers:
+            records += benchmark_case(
+                os.path.join(repo_path, "bin", solver), os.path.join(repo_path, case),
+                args.tfinal, args.nthreads)
+
+    write_records(records, args.output)
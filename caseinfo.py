@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Load setrun.py of cases without touching global states.
+
+The setrun.py of a case is loaded as an anonymous module from its file path,
+so neither the working directory, nor sys.path, nor sys.modules is modified.
+Relative file paths in the resulting ClawRunData are resolved against the case
+folder. Hence, several cases can be loaded from different threads at once.
+"""
+import os
+import threading
+
+
+# cached case information: casepath -> (mtime of setrun.py, info dict)
+_info_cache = {}
+_info_lock = threading.Lock()
+
+
+def load_rundata(casepath):
+    """Build the ClawRunData object of a case from its setrun.py."""
+    import importlib.util
+
+    casepath = os.path.abspath(casepath)
+    setrunpath = os.path.join(casepath, "setrun.py")
+
+    if not os.path.isfile(setrunpath):
+        raise FileNotFoundError("Case folder {} does not have setrun.py.".format(casepath))
+
+    # an anonymous module that is not registered in sys.modules
+    spec = importlib.util.spec_from_file_location(
+        "setrun_{}".format(abs(hash(casepath))), setrunpath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    rundata = module.setrun() # get ClawRunData object
+
+    # file names are the last items of these lists; make them absolute
+    filelists = [rundata.topo_data.topofiles]
+    if hasattr(rundata, "dtopo_data"):
+        filelists.append(rundata.dtopo_data.dtopofiles)
+    if hasattr(rundata, "qinit_data"):
+        filelists.append(rundata.qinit_data.qinitfiles)
+
+    for filelist in filelists:
+        for item in filelist:
+            if not os.path.isabs(item[-1]):
+                item[-1] = os.path.normpath(os.path.join(casepath, item[-1]))
+
+    return rundata
+
+def get_case_info(casepath):
+    """Get the metadata of a case from its setrun.py.
+
+    The result is cached until setrun.py is modified. The returned dict
+    contains:
+
+        nframes: number of output frames (including the initial one)
+        nlevels: maximum AMR level
+        num_cells: [nx, ny] on level 1
+        lower, upper: [x, y] of the domain corners
+        refinement_ratios: list of [rx, ry, rt] between consecutive levels
+        num_eqn, num_aux, num_ghost: array dimensions of frames
+        num_output_times, tfinal: output settings
+        output_aux: whether aux arrays are written to frames
+        dry_tolerance: the dry tolerance of GeoClaw
+        gravity: the gravitational acceleration
+        cells: worst-case number of cells on each level
+    """
+
+    casepath = os.path.abspath(casepath)
+    mtime = os.path.getmtime(os.path.join(casepath, "setrun.py"))
+
+    with _info_lock:
+        if casepath in _info_cache and _info_cache[casepath][0] == mtime:
+            return dict(_info_cache[casepath][1])
+
+    rundata = load_rundata(casepath)
+    clawdata = rundata.clawdata
+    amrdata = rundata.amrdata
+
+    nlevels = amrdata.amr_levels_max
+    ratios = [
+        [amrdata.refinement_ratios_x[i], amrdata.refinement_ratios_y[i],
+         amrdata.refinement_ratios_t[i]] for i in range(nlevels-1)]
+
+    cells = [clawdata.num_cells[0] * clawdata.num_cells[1]]
+    for rx, ry, _ in ratios:
+        cells.append(cells[-1] * rx * ry)
+
+    info = {
+        "nframes": clawdata.num_output_times + 1,
+        "nlevels": nlevels,
+        "num_cells": list(clawdata.num_cells),
+        "lower": list(clawdata.lower),
+        "upper": list(clawdata.upper),
+        "refinement_ratios": ratios,
+        "num_eqn": clawdata.num_eqn,
+        "num_aux": clawdata.num_aux,
+        "num_ghost": clawdata.num_ghost,
+        "num_output_times": clawdata.num_output_times,
+        "tfinal": clawdata.tfinal,
+        "output_aux": clawdata.output_aux_components != "none",
+        "dry_tolerance": rundata.geo_data.dry_tolerance,
+        "gravity": rundata.geo_data.gravity,
+        "cells": cells}
+
+    with _info_lock:
+        _info_cache[casepath] = (mtime, info)
+
+    return dict(info)
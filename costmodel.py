@@ -0,0 +1,161 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Estimate the costs of cases and order them for scheduling.
+
+The cost of a case is modeled as a linear combination of a few features read
+from its setrun.py:
+
+    0. level-1 work: cells on level 1 x time steps on level 1
+    1. finer-level work: worst-case cells x time steps on levels 2 and up
+    2. output work: number of output times x worst-case cells on all levels
+    3. a constant overhead
+
+The unit of the cost is thread-seconds (wall time x OpenMP threads). The
+coefficients start from rough defaults and are refitted from the wall times
+of earlier runs, which are stored in neck_test_timings.json.
+"""
+import os
+import json
+import logging
+import caseinfo
+
+
+# logger
+logger = logging.getLogger("costmodel.py")
+
+# rough initial coefficients of the features
+default_coeffs = [2e-7, 2e-8, 2e-7, 1.0]
+
+
+def get_features(casepath):
+    """Get the cost features of a case from its setrun.py."""
+
+    info = caseinfo.get_case_info(casepath)
+
+    dx = (info["upper"][0] - info["lower"][0]) / info["num_cells"][0]
+
+    # worst-case cells and time steps on each level
+    cells = info["cells"]
+    steps = [info["tfinal"] / dx]
+    for _, _, rt in info["refinement_ratios"]:
+        steps.append(steps[-1] * rt)
+
+    return [
+        cells[0] * steps[0],
+        sum([c * s for c, s in zip(cells[1:], steps[1:])]),
+        info["num_output_times"] * sum(cells),
+        1.0]
+
+def predict(features, coeffs=None):
+    """Predict the cost (thread-seconds) of a case from its features."""
+
+    if coeffs is None:
+        coeffs = default_coeffs
+
+    return sum([c * f for c, f in zip(coeffs, features)])
+
+def load_timings(dbfile):
+    """Load the records of measured wall times."""
+
+    if not os.path.isfile(dbfile):
+        return []
+
+    with open(dbfile, "r") as f:
+        return json.load(f)
+
+def record_timings(dbfile, records):
+    """Append records of measured wall times to the database.
+
+    Each record is a dict with keys `case`, `solver`, `nthreads`, `walltime`,
+    and `features`.
+    """
+
+    data = load_timings(dbfile) + list(records)
+
+    with open(dbfile, "w") as f:
+        json.dump(data, f, indent=1)
+
+    logger.info("Recorded %d wall times in %s", len(records), dbfile)
+
+def fit_coeffs(records):
+    """Refit the coefficients from measured wall times.
+
+    With fewer records than coefficients, the default coefficients are only
+    scaled by the median ratio of the measured to the predicted costs.
+    Otherwise, a non-negative least-squares fit is done on the relative
+    errors so that small cases weigh as much as large ones.
+    """
+    import numpy
+
+    if not records:
+        return list(default_coeffs)
+
+    A = numpy.array([r["features"] for r in records], dtype=numpy.float64)
+    b = numpy.array(
+        [r["walltime"] * r["nthreads"] for r in records], dtype=numpy.float64)
+
+    if len(records) < len(default_coeffs):
+        ratio = float(numpy.median(b / A.dot(default_coeffs)))
+        return [c * ratio for c in default_coeffs]
+
+    # scale each row by its measured cost, i.e., fit relative errors
+    A = A / b[:, None]
+    b = numpy.ones_like(b)
+
+    # a naive active-set NNLS: drop negative coefficients and refit
+    active = numpy.ones(A.shape[1], dtype=bool)
+    coeffs = numpy.zeros(A.shape[1], dtype=numpy.float64)
+    while active.any():
+        x = numpy.linalg.lstsq(A[:, active], b, rcond=None)[0]
+        if (x >= 0).all():
+            coeffs[active] = x
+            break
+        idx = numpy.flatnonzero(active)
+        active[idx[x < 0]] = False
+
+    logger.debug("Refitted coefficients: %s", coeffs)
+    return coeffs.tolist()
+
+def estimate_costs(casepaths, dbfile=None):
+    """Estimate the costs (thread-seconds) of cases.
+
+    If `dbfile` exists, the coefficients are refitted from its records first.
+    Returns the costs and the features of the cases.
+    """
+
+    coeffs = default_coeffs
+    if dbfile is not None:
+        coeffs = fit_coeffs(load_timings(dbfile))
+
+    features = [get_features(case) for case in casepaths]
+    costs = [predict(f, coeffs) for f in features]
+
+    return costs, features
+
+def lpt_order(costs):
+    """Indices of the jobs in longest-processing-time-first order."""
+    return sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+
+def lpt_pack(costs, nslots):
+    """Pack jobs onto slots with the longest-processing-time-first policy.
+
+    Returns a list of job-index lists (one per slot) and the predicted
+    makespan.
+    """
+
+    slots = [[] for _ in range(nslots)]
+    loads = [0.0] * nslots
+
+    for i in lpt_order(costs):
+        k = loads.index(min(loads))
+        slots[k].append(i)
+        loads[k] += costs[i]
+
+    return slots, max(loads)
@@ -33,8 +33,8 @@ logger.addHandler(fh)
 
 def plot_single_volume(cases, subtitle, savepath):
     """Plot a single figure for volume vs time plot."""
-    import numpy
     from matplotlib import pyplot
+    import diagstore
 
     repo_path = os.path.dirname(os.path.abspath(__file__))
 
@@ -42,13 +42,15 @@ def plot_single_volume(cases, subtitle, savepath):
 
     for label, [case, idx, style] in cases.items():
         case = os.path.join(repo_path, case)
-        datafile = os.path.join(case, "volume.csv")
+        datafile = os.path.join(case, "volume.store", "schema.json")
         if not os.path.isfile(datafile):
             logger.error("Couldn't find %s. Exit now", datafile)
             raise FileNotFoundError("Couldn't find {}. Exit now".format(datafile))
 
-        data = numpy.loadtxt(os.path.join(case, "volume.csv"), delimiter=",")
-        pyplot.plot(data[:, 0], data[:, idx], label=label, **style)
+        # only the two columns needed are read
+        column = "level{}".format(idx)
+        data = diagstore.read_columns(os.path.join(case, "volume.store"), ["t", column])
+        pyplot.plot(data["t"], data[column], label=label, **style)
 
     pyplot.title("Volume v.s. time, {}".format(subtitle))
     pyplot.xlabel(r"$Time\ (sec)$")
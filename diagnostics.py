@@ -0,0 +1,303 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Calculate integrals and extrema of flows in one pass over the frames.
+
+For each frame, every patch is read once and all requested quantities are
+reduced on each AMR level and on the composite grid (cells not covered by finer
+patches). The results of a case go to the store diagnostics.store in the case
+folder (see diagstore.py), with columns frame, mtime_t, mtime_q, mtime_b,
+mtime_a, t, <quantity>_level1, ..., <quantity>_composite; other columns already
+in the store are kept. A store whose frames or their modification times no
+longer match _output, e.g., after the case ran again, is rewritten.
+
+Energies are per unit density, with the topography elevation b in aux[0]:
+potential energy = g h (b + h/2) dA, and kinetic energy = (hu^2 + hv^2) / (2h) dA
+on wet cells.
+"""
+import os
+import sys
+import logging
+import caseinfo
+import framereader
+import frameindex
+import totalvolume
+import diagstore
+
+
+# logger
+logger = logging.getLogger("diagnostics.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_diagnostics.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+# available quantities and how they are reduced over cells
+quantity_reductions = [
+    ("volume", "sum"), ("momentum_x", "sum"), ("momentum_y", "sum"),
+    ("energy_potential", "sum"), ("energy_kinetic", "sum"),
+    ("wet_cells", "sum"), ("wet_area", "sum"),
+    ("max_depth", "max"), ("max_speed", "max")]
+
+all_quantities = [name for name, _ in quantity_reductions]
+reductions = dict(quantity_reductions)
+
+# modification times of the files of each frame when it was reduced
+mtime_names = ["mtime_t", "mtime_q", "mtime_b", "mtime_a"]
+
+
+def get_cell_values(q, aux, area, dry_tolerance, gravity, quantities):
+    """Get the per-cell values of quantities on a patch.
+
+    Quantities reduced by sum are multiplied by the cell area. Returns a dict
+    of (mx, my) arrays.
+    """
+    import numpy
+
+    h = q[0]
+    wet = h > dry_tolerance
+
+    values = {}
+    if "volume" in quantities:
+        values["volume"] = h * area
+    if "momentum_x" in quantities:
+        values["momentum_x"] = q[1] * area
+    if "momentum_y" in quantities:
+        values["momentum_y"] = q[2] * area
+    if "energy_potential" in quantities:
+        values["energy_potential"] = gravity * h * (aux[0] + 0.5 * h) * area
+    if "wet_cells" in quantities:
+        values["wet_cells"] = wet.astype(numpy.float64)
+    if "wet_area" in quantities:
+        values["wet_area"] = wet * area
+    if "max_depth" in quantities:
+        values["max_depth"] = numpy.array(h)
+
+    if "energy_kinetic" in quantities or "max_speed" in quantities:
+        hwet = numpy.where(wet, h, 1.)
+        momentum2 = numpy.where(wet, q[1]**2 + q[2]**2, 0.)
+        if "energy_kinetic" in quantities:
+            values["energy_kinetic"] = 0.5 * momentum2 / hwet * area
+        if "max_speed" in quantities:
+            values["max_speed"] = numpy.sqrt(momentum2) / hwet
+
+    return values
+
+def reduce(values, name):
+    """Reduce an array of per-cell values of a quantity to a number."""
+    import numpy
+
+    if values.size == 0:
+        return 0.
+
+    if reductions[name] == "max":
+        return float(numpy.max(values))
+
+    return float(numpy.sum(values))
+
+def get_diagnostics_single_frame(nlevels, solution, dry_tolerance, gravity, quantities):
+    """Get the quantities on each level and on the composite grid of a frame.
+
+    Returns an array of shape (len(quantities), nlevels+1); the last column is
+    the composite grid.
+    """
+    import numpy
+
+    masks = totalvolume.get_coverage_masks(solution)
+
+    results = numpy.zeros((len(quantities), nlevels+1), dtype=numpy.float64)
+    for state, mask in zip(solution.states, masks):
+        p = state.patch
+        area = p.delta[0] * p.delta[1]
+        values = get_cell_values(state.q, state.aux, area, dry_tolerance, gravity, quantities)
+
+        for i, name in enumerate(quantities):
+            level_value = reduce(values[name], name)
+            composite_value = reduce(values[name][~mask], name)
+            if reductions[name] == "max":
+                results[i, p.level-1] = max(results[i, p.level-1], level_value)
+                results[i, -1] = max(results[i, -1], composite_value)
+            else:
+                results[i, p.level-1] += level_value
+                results[i, -1] += composite_value
+
+    return results
+
+def get_chunk_diagnostics(out_path, framenos, nlevels, dry_tolerance, gravity, quantities, index=None):
+    """Return a list of (time, diagnostics) of several frames."""
+
+    read_aux = "energy_potential" in quantities
+
+    results = []
+    for fno in framenos:
+        soln = framereader.read_frame(
+            out_path, fno, read_aux=read_aux, index=index, components=slice(0, 3))
+        results.append((soln.state.t, get_diagnostics_single_frame(
+            nlevels, soln, dry_tolerance, gravity, quantities)))
+
+    return results
+
+def get_column_names(nlevels, quantities):
+    """Column names of the diagnostics store, except frame."""
+
+    names = ["t"]
+    for name in quantities:
+        names += ["{}_level{}".format(name, lvl) for lvl in range(1, nlevels+1)]
+        names.append("{}_composite".format(name))
+
+    return names
+
+def is_store_current(path, index):
+    """Check if a diagnostics store with mtime columns has the frames of an
+    index, reduced from files with the same modification times."""
+    import numpy
+
+    old = diagstore.read_columns(path, ["frame"]+mtime_names)
+    return all([numpy.array_equal(old[name], index.frames[name]) for name in ["frame"]+mtime_names])
+
+def create_diagnostics_files(cases, nprocs=None, quantities=None):
+    """Create the diagnostics stores of cases with a pool of processes.
+
+    Frames of all cases are split into chunks of consecutive frames and
+    distributed to the processes by `framereader.map_frames`. A case is skipped
+    if its store is current (see `is_store_current`) and has all the
+    quantities. A store that is not current is rewritten with only the
+    requested quantities; a store without mtime columns, e.g., one only with
+    error norms (see errornorms.py), gets the new columns merged.
+
+    Arguments:
+        cases: a list of case folders.
+        nprocs: number of processes; default to the number of CPUs.
+        quantities: a list of names in `all_quantities`; default to all.
+    """
+    import numpy
+
+    quantities = all_quantities if quantities is None else quantities
+    for name in quantities:
+        if name not in reductions:
+            raise ValueError("Unknown quantity: {}".format(name))
+
+    # metadata of cases not done yet, the largest ones first
+    todo = {}
+    indices = {}
+    stale = set()
+    for casepath in cases:
+        casepath = os.path.abspath(casepath)
+        info = caseinfo.get_case_info(casepath)
+        index = frameindex.load_index(os.path.join(casepath, "_output"))
+        if len(index.frames) == 0:
+            logger.warning("No frames in %s. Skip.", os.path.join(casepath, "_output"))
+            continue
+
+        path = os.path.join(casepath, "diagnostics.store")
+        names = []
+        if os.path.isfile(os.path.join(path, "schema.json")):
+            names = [name for name, _ in diagstore.read_schema(path)[0]]
+
+        if all([name in names for name in mtime_names]) and not is_store_current(path, index):
+            logger.warning("%s does not match the frames in _output. Rewrite it.", path)
+            stale.add(casepath)
+        elif all([name in names for name in mtime_names+get_column_names(info["nlevels"], quantities)]):
+            logger.warning("%s has all the quantities. Skip.", path)
+            continue
+
+        todo[casepath] = info
+        indices[casepath] = index
+
+    if not todo:
+        return
+
+    todo = dict(sorted(todo.items(), key=lambda item: -sum(item[1]["cells"])))
+    for casepath in todo:
+        logger.info("Creating diagnostics store for case %s", casepath)
+
+    def get_args(casepath, framenos):
+        info = todo[casepath]
+        return (os.path.join(casepath, "_output"), framenos, info["nlevels"],
+                info["dry_tolerance"], info["gravity"], quantities,
+                frameindex.select_frames(indices[casepath], framenos))
+
+    for casepath, results in framereader.map_frames(
+            get_chunk_diagnostics,
+            {casepath: indices[casepath].frames["frame"].tolist() for casepath in todo},
+            get_args, nprocs):
+        frames = indices[casepath].frames
+        nlevels = todo[casepath]["nlevels"]
+        data = numpy.zeros((len(frames), 1+len(quantities)*(nlevels+1)), dtype=numpy.float64)
+        for i, fno in enumerate(frames["frame"].tolist()):
+            t, values = results[fno]
+            data[i, 0] = t
+            data[i, 1:] = values.ravel()
+
+        names = get_column_names(nlevels, quantities)
+        columns = [("frame", "i4")] + [(name, "i8") for name in mtime_names] + \
+            [(name, "f8") for name in names]
+        values = {name: data[:, i] for i, name in enumerate(names)}
+        for name in ["frame"]+mtime_names:
+            values[name] = frames[name]
+
+        path = os.path.join(casepath, "diagnostics.store")
+        if casepath in stale:
+            diagstore.write_store(path, columns, values)
+        else:
+            diagstore.merge_columns(path, columns, values)
+        logger.info("Done creating diagnostics store for case %s", casepath)
+
+    logger.handlers[0].flush()
+    logger.handlers[1].flush()
+
+if __name__ == "__main__":
+    import argparse
+    import run
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(description="Create diagnostics stores of cases.")
+
+    parser.add_argument(
+        '--cases', dest='cases', type=str, nargs="+", default=None,
+        help='case folders (default: all cases)')
+
+    parser.add_argument(
+        '--nprocs', dest='nprocs', type=int, default=None,
+        help='number of processes reading frames (default: number of CPUs)')
+
+    parser.add_argument(
+        '--quantities', dest='quantities', type=str, nargs="+", default=None,
+        choices=all_quantities, help='quantities to calculate (default: all)')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    if args.cases is None:
+        cases = [case for _, case in run.get_all_jobs()]
+    else:
+        cases = args.cases
+
+    create_diagnostics_files(cases, args.nprocs, args.quantities)
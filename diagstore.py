@@ -0,0 +1,199 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+A columnar binary store for per-frame results.
+
+A store is a folder with schema.json and one raw binary file per column:
+
+    schema.json: {"columns": [[name, dtype], ...], "nrows": number of rows}
+    <name>.bin: the values of a column, little-endian, one after another
+
+Rows are appended by appending to the column files first and then updating
+nrows in schema.json with a rename, so a crash in between leaves extra bytes
+that are ignored. Columns are read as read-only numpy.memmap arrays, so readers
+only touch the columns they need.
+
+Running this file prints a store as CSV, e.g.,
+`$ python diagstore.py amr-tests/original/volume.store --columns t level1`.
+"""
+import os
+import json
+
+
+def read_schema(path):
+    """Read the schema of a store; return (a list of (name, dtype)), nrows)."""
+
+    with open(os.path.join(path, "schema.json"), "r") as f:
+        schema = json.load(f)
+
+    return [tuple(col) for col in schema["columns"]], schema["nrows"]
+
+def write_schema(path, columns, nrows):
+    """Write schema.json through a temporary file and a rename."""
+
+    tmpfile = os.path.join(path, "schema.json.{}.tmp".format(os.getpid()))
+    with open(tmpfile, "w") as f:
+        json.dump({"columns": [list(col) for col in columns], "nrows": nrows}, f)
+    os.replace(tmpfile, os.path.join(path, "schema.json"))
+
+def get_column_file(path, name):
+    """The binary file of a column."""
+    return os.path.join(path, "{}.bin".format(name))
+
+def normalize_columns(columns):
+    """Turn a list of (name, dtype) into the form kept in schema.json."""
+    import numpy
+
+    return [(name, numpy.dtype(dtype).newbyteorder("<").str) for name, dtype in columns]
+
+def create_store(path, columns):
+    """Create an empty store (or empty an existing one) with the given columns.
+
+    Arguments:
+        path: the folder of the store.
+        columns: a list of (name, dtype), e.g., [("t", "f8"), ("frame", "i4")].
+    """
+    columns = normalize_columns(columns)
+
+    os.makedirs(path, exist_ok=True)
+
+    # no rows are valid while the column files are being truncated
+    write_schema(path, columns, 0)
+    for name in os.listdir(path):
+        if name.endswith(".bin"):
+            os.remove(os.path.join(path, name))
+    for name, _ in columns:
+        open(get_column_file(path, name), "wb").close()
+
+def append_rows(path, data):
+    """Append rows to a store.
+
+    `data` is a dict of column name -> 1D array; all columns of the store must
+    be given and have the same length.
+    """
+    import numpy
+
+    columns, nrows = read_schema(path)
+
+    arrays = [numpy.asarray(data[name], dtype=dtype) for name, dtype in columns]
+    nnew = len(arrays[0])
+    if any([len(array) != nnew for array in arrays]):
+        raise ValueError("Columns have different numbers of rows.")
+
+    for (name, dtype), array in zip(columns, arrays):
+        filename = get_column_file(path, name)
+
+        # drop bytes left by an interrupted append
+        nbytes = nrows * numpy.dtype(dtype).itemsize
+        if os.path.getsize(filename) != nbytes:
+            os.truncate(filename, nbytes)
+
+        with open(filename, "ab") as f:
+            f.write(array.tobytes())
+
+    write_schema(path, columns, nrows+nnew)
+
+def write_store(path, columns, data):
+    """Replace the content of a store with the given columns and data."""
+    create_store(path, columns)
+    append_rows(path, data)
+
+def merge_columns(path, columns, data, key="frame"):
+    """Add or replace columns of a store, matching rows by a key column.
+
+    Rows of the store and of `data` are matched by the values of `key` (which
+    must be in both `columns` and `data`). If the keys differ, the store is
+    rewritten with the sorted union of them, and missing values are filled
+    with NaN (or 0 for integer columns). Creates the store if it does not exist.
+    """
+    import numpy
+
+    columns = normalize_columns(columns)
+    keys = numpy.asarray(data[key])
+
+    if not os.path.isfile(os.path.join(path, "schema.json")):
+        order = numpy.argsort(keys, kind="mergesort")
+        write_store(path, columns, {name: numpy.asarray(data[name])[order] for name, _ in columns})
+        return
+
+    old_columns, _ = read_schema(path)
+    old = {name: numpy.array(values) for name, values in read_columns(path).items()}
+
+    # the rows of the merged store
+    merged_keys = numpy.union1d(old[key], keys)
+
+    def align(values, dtype, src_keys):
+        dtype = numpy.dtype(dtype)
+        out = numpy.full(len(merged_keys), numpy.nan if dtype.kind == "f" else 0, dtype=dtype)
+        out[numpy.searchsorted(merged_keys, src_keys)] = values
+        return out
+
+    merged = {}
+    merged_columns = []
+    for name, dtype in old_columns:
+        merged[name] = align(old[name], dtype, old[key])
+        merged_columns.append((name, dtype))
+
+    for name, dtype in columns:
+        values = align(numpy.asarray(data[name]), dtype, keys)
+        if name in merged:
+            # keep old values on rows the new data do not have
+            mask = numpy.isin(merged_keys, keys)
+            merged[name][mask] = values[mask]
+        else:
+            merged[name] = values
+            merged_columns.append((name, dtype))
+
+    write_store(path, merged_columns, merged)
+
+def read_columns(path, names=None):
+    """Read columns of a store as read-only memory-mapped arrays.
+
+    Returns a dict of column name -> array; `names` selects the columns (default:
+    all).
+    """
+    import numpy
+
+    columns, nrows = read_schema(path)
+    dtypes = dict(columns)
+    names = [name for name, _ in columns] if names is None else names
+
+    data = {}
+    for name in names:
+        if name not in dtypes:
+            raise KeyError("No column {} in {}".format(name, path))
+        if nrows == 0:
+            data[name] = numpy.zeros(0, dtype=dtypes[name])
+        else:
+            data[name] = numpy.memmap(
+                get_column_file(path, name), dtype=dtypes[name], mode="r", shape=(nrows,))
+
+    return data
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    import numpy
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(description="Print a store as CSV.")
+
+    parser.add_argument('store', type=str, help='folder of the store')
+
+    parser.add_argument(
+        '--columns', dest='columns', type=str, nargs="+", default=None,
+        help='columns to print (default: all)')
+
+    args = parser.parse_args()
+
+    data = read_columns(args.store, args.columns)
+    names = list(data)
+    numpy.savetxt(
+        sys.stdout.buffer, numpy.column_stack([data[name] for name in names]),
+        delimiter=",", header=",".join(names), comments="")
@@ -0,0 +1,210 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Error norms of cases against a reference solution.
+
+Frames with the same number in a case and in the reference (by default,
+single-mesh-tests/dx=0.125) are resampled onto a common uniform grid (see
+resample.py), and the L1, L2, and L-infinity norms of the differences in depth
+and x/y momentum are calculated:
+
+    L1 = sum |e| dA,  L2 = sqrt(sum e^2 dA),  Linf = max |e|
+
+By default, the common grid has the cell size of the case's finest level, so
+the reference is averaged down to the resolution the case resolves. Frames are
+processed in parallel, and the norms go to the diagnostics store of each case
+(see diagstore.py) as columns error_<variable>_<norm>, plus error_dx.
+"""
+import os
+import sys
+import logging
+import caseinfo
+import framereader
+import frameindex
+import diagstore
+import resample
+
+
+# logger
+logger = logging.getLogger("errornorms.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_errornorms.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+variables = ["depth", "momentum_x", "momentum_y"]
+norms = ["l1", "l2", "linf"]
+
+
+def get_column_names():
+    """Names of the error columns in the diagnostics store."""
+    return ["error_{}_{}".format(var, norm) for var in variables for norm in norms]
+
+def get_finest_dx(casepath):
+    """Cell size in x of the finest level of a case."""
+
+    info = caseinfo.get_case_info(casepath)
+    dx = (info["upper"][0] - info["lower"][0]) / info["num_cells"][0]
+    for rx, _, _ in info["refinement_ratios"]:
+        dx /= rx
+
+    return dx
+
+def get_frame_errors(casepath, refpath, frameno, dx):
+    """Error norms of a frame of a case against the same frame of the reference.
+
+    Returns a list of values in the order of `get_column_names`.
+    """
+    import numpy
+
+    case = resample.get_resampled(casepath, frameno, dx, slice(0, len(variables)))
+    ref = resample.get_resampled(refpath, frameno, dx, slice(0, len(variables)))
+    if case.shape != ref.shape:
+        raise ValueError("{} and {} have different domains".format(casepath, refpath))
+
+    area = dx * dx
+    errors = []
+    for m in range(len(variables)):
+        diff = numpy.abs(case[m] - ref[m])
+        errors.append(float(numpy.nansum(diff) * area))
+        errors.append(float(numpy.sqrt(numpy.nansum(diff**2) * area)))
+        errors.append(float(numpy.nanmax(diff)))
+
+    return errors
+
+def get_chunk_errors(casepath, refpath, framenos, dx):
+    """Return a list of error norms of several frames."""
+    return [get_frame_errors(casepath, refpath, fno, dx) for fno in framenos]
+
+def create_error_norms(cases, refpath, dx=None, nprocs=None):
+    """Calculate error norms of cases against the reference with a pool of
+    processes and add them to the diagnostics stores of the cases.
+
+    Arguments:
+        cases: a list of case folders.
+        refpath: the folder of the reference case.
+        dx: cell size of the common grid; default to the finest one of each case.
+        nprocs: number of processes; default to the number of CPUs.
+    """
+    import numpy
+
+    refpath = os.path.abspath(refpath)
+
+    ref_index = frameindex.load_index(os.path.join(refpath, "_output"))
+    ref_times = dict(zip(ref_index.frames["frame"].tolist(), ref_index.frames["t"].tolist()))
+
+    # frames of each case that the reference also has
+    todo = {}
+    for casepath in cases:
+        casepath = os.path.abspath(casepath)
+        if casepath == refpath:
+            continue
+
+        index = frameindex.load_index(os.path.join(casepath, "_output"))
+        framenos = []
+        for fno, t in zip(index.frames["frame"].tolist(), index.frames["t"].tolist()):
+            if fno not in ref_times:
+                continue
+            if abs(t-ref_times[fno]) > 1e-6 * max(1., abs(t)):
+                logger.warning("Frame %d of %s is at t=%g but the reference is at t=%g. Skip.",
+                               fno, casepath, t, ref_times[fno])
+                continue
+            framenos.append(fno)
+
+        if not framenos:
+            logger.warning("%s has no frames matching the reference. Skip.", casepath)
+            continue
+
+        todo[casepath] = {
+            "framenos": framenos, "times": [ref_times[fno] for fno in framenos],
+            "dx": get_finest_dx(casepath) if dx is None else dx}
+
+    if not todo:
+        return
+
+    for casepath, case in todo.items():
+        logger.info("Comparing %d frames of %s with the reference on dx=%g",
+                    len(case["framenos"]), casepath, case["dx"])
+
+    def get_args(casepath, framenos):
+        return casepath, refpath, framenos, todo[casepath]["dx"]
+
+    for casepath, results in framereader.map_frames(
+            get_chunk_errors, {casepath: case["framenos"] for casepath, case in todo.items()},
+            get_args, nprocs):
+        case = todo[casepath]
+        names = get_column_names()
+        errors = numpy.array([results[fno] for fno in case["framenos"]])
+        data = {"frame": case["framenos"], "t": case["times"],
+                "error_dx": numpy.full(len(case["framenos"]), case["dx"])}
+        data.update({name: errors[:, i] for i, name in enumerate(names)})
+        columns = [("frame", "i4"), ("t", "f8"), ("error_dx", "f8")] + \
+            [(name, "f8") for name in names]
+
+        diagstore.merge_columns(os.path.join(casepath, "diagnostics.store"), columns, data)
+        logger.info("Done error norms of %s; max L2 depth error %g", casepath,
+                    errors[:, names.index("error_depth_l2")].max())
+
+    logger.handlers[0].flush()
+    logger.handlers[1].flush()
+
+if __name__ == "__main__":
+    import argparse
+    import run
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(
+        description="Error norms of cases against a reference case.")
+
+    parser.add_argument(
+        '--cases', dest='cases', type=str, nargs="+", default=None,
+        help='case folders (default: all cases except the reference)')
+
+    parser.add_argument(
+        '--reference', dest='reference', type=str, default="single-mesh-tests/dx=0.125",
+        help='reference case folder (default: single-mesh-tests/dx=0.125)')
+
+    parser.add_argument(
+        '--dx', dest='dx', type=float, default=None,
+        help='cell size of the common grid (default: the finest one of each case)')
+
+    parser.add_argument(
+        '--nprocs', dest='nprocs', type=int, default=None,
+        help='number of processes (default: number of CPUs)')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    if args.cases is None:
+        cases = [case for _, case in run.get_all_jobs()]
+    else:
+        cases = args.cases
+
+    create_error_norms(cases, os.path.join(repo_path, args.reference), args.dx, args.nprocs)
@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+A persistent index of the frames and patches in an output folder.
+
+The index is kept in _output/.frameindex.npz and has two structured arrays:
+
+    frames: one row per frame with its time, array dimensions, and the
+        modification times of its fort.t, fort.q, fort.b, and fort.a files;
+    patches: one row per patch, sorted by frame, with the patch header and the
+        byte offsets of the patch in fort.bNNNN and fort.aNNNN.
+
+A frame is (re-)indexed only when it is new or one of its files has a different
+modification time, so loading the index of a finished run costs a few stat
+calls per frame instead of parsing every fort.qNNNN.
+"""
+import os
+import glob
+import collections
+import numpy
+import framereader
+
+
+frame_dtype = numpy.dtype([
+    ("frame", "i4"), ("t", "f8"), ("num_eqn", "i4"), ("num_aux", "i4"),
+    ("num_ghost", "i4"), ("num_patches", "i4"), ("mtime_t", "i8"),
+    ("mtime_q", "i8"), ("mtime_b", "i8"), ("mtime_a", "i8")])
+
+patch_dtype = numpy.dtype([
+    ("frame", "i4"), ("level", "i4"), ("grid_number", "i4"), ("mx", "i4"),
+    ("my", "i4"), ("xlow", "f8"), ("ylow", "f8"), ("dx", "f8"), ("dy", "f8"),
+    ("q_offset", "i8"), ("aux_offset", "i8")])
+
+FrameIndex = collections.namedtuple("FrameIndex", ["frames", "patches"])
+
+index_name = ".frameindex.npz"
+
+
+def get_mtimes(out_path, frameno):
+    """Modification times (ns) of fort.t, fort.q, fort.b, and fort.a of a frame;
+    -1 for missing files."""
+
+    mtimes = []
+    for prefix in ["fort.t", "fort.q", "fort.b", "fort.a"]:
+        try:
+            mtimes.append(os.stat(os.path.join(
+                out_path, "{}{:04}".format(prefix, frameno))).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(-1)
+
+    return mtimes
+
+def index_frame(out_path, frameno, mtimes):
+    """Parse the headers of a frame; return its frame row and patch rows."""
+
+    info = framereader.read_t(out_path, frameno)
+    headers = framereader.read_patch_headers(out_path, frameno)
+
+    frame = numpy.zeros(1, dtype=frame_dtype)
+    frame[0] = (frameno, info["t"], info["num_eqn"], info["num_aux"],
+                info["num_ghost"], len(headers), *mtimes)
+
+    g = info["num_ghost"]
+    patches = numpy.zeros(len(headers), dtype=patch_dtype)
+    q_offset = aux_offset = 0
+    for i, h in enumerate(headers):
+        patches[i] = (frameno, h["level"], h["grid_number"], h["mx"], h["my"],
+                      h["xlow"], h["ylow"], h["dx"], h["dy"], q_offset, aux_offset)
+        size = 8 * (h["mx"]+2*g) * (h["my"]+2*g)
+        q_offset += info["num_eqn"] * size
+        aux_offset += info["num_aux"] * size
+
+    return frame, patches
+
+def load_index(out_path):
+    """Load the index of an output folder, updating it for new or changed frames.
+
+    Only frames whose fort.t exists are indexed, as the solver writes fort.t
+    after the other files of a frame.
+    """
+
+    indexfile = os.path.join(out_path, index_name)
+
+    old = FrameIndex(numpy.zeros(0, dtype=frame_dtype), numpy.zeros(0, dtype=patch_dtype))
+    if os.path.isfile(indexfile):
+        try:
+            with numpy.load(indexfile) as f:
+                old = FrameIndex(f["frames"], f["patches"])
+        except (IOError, ValueError, KeyError): # corrupted; rebuild it
+            pass
+
+    framenos = sorted([int(os.path.basename(f)[6:]) for f in
+                       glob.glob(os.path.join(out_path, "fort.t"+"[0-9]"*4))])
+
+    frames = []
+    patches = []
+    changed = len(framenos) != len(old.frames)
+    for fno in framenos:
+        mtimes = get_mtimes(out_path, fno)
+
+        # reuse the rows of an unchanged frame
+        k = numpy.searchsorted(old.frames["frame"], fno)
+        if k < len(old.frames) and old.frames["frame"][k] == fno and mtimes == [
+                int(old.frames[key][k]) for key in ["mtime_t", "mtime_q", "mtime_b", "mtime_a"]]:
+            frames.append(old.frames[k:k+1])
+            patches.append(get_frame(old, fno)[1])
+            continue
+
+        frame, frame_patches = index_frame(out_path, fno, mtimes)
+        frames.append(frame)
+        patches.append(frame_patches)
+        changed = True
+
+    index = FrameIndex(
+        numpy.concatenate(frames) if frames else old.frames[:0],
+        numpy.concatenate(patches) if patches else old.patches[:0])
+
+    # write to a temporary file and rename, so readers never see a partial index
+    if changed:
+        tmpfile = "{}.{}.tmp".format(indexfile, os.getpid())
+        with open(tmpfile, "wb") as f:
+            numpy.savez(f, frames=index.frames, patches=index.patches)
+        os.replace(tmpfile, indexfile)
+
+    return index
+
+def get_frame(index, frameno):
+    """Return the frame row and the patch rows of a frame in an index."""
+
+    k = numpy.searchsorted(index.frames["frame"], frameno)
+    if k >= len(index.frames) or index.frames["frame"][k] != frameno:
+        raise KeyError("Frame {} is not in the index".format(frameno))
+
+    bg = numpy.searchsorted(index.patches["frame"], frameno, "left")
+    ed = numpy.searchsorted(index.patches["frame"], frameno, "right")
+
+    return index.frames[k], index.patches[bg:ed]
+
+def select_frames(index, framenos):
+    """Return a smaller index with only the given frames, e.g., to send to a
+    worker process."""
+
+    return FrameIndex(
+        index.frames[numpy.isin(index.frames["frame"], framenos)],
+        index.patches[numpy.isin(index.patches["frame"], framenos)])
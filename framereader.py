@@ -0,0 +1,290 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Lightweight readers of GeoClaw binary output frames.
+
+A frame NNNN consists of fort.tNNNN (time and array dimensions), fort.qNNNN
+(a text header for each patch), fort.bNNNN (q of all patches), and fort.aNNNN
+(aux of all patches).
+
+`read_frame` maps fort.bNNNN and fort.aNNNN into memory and returns a
+solution-like object whose q and aux arrays are views into the files, so it can
+replace `pyclaw.Solution.read` wherever only `soln.states`, `soln.state.t`,
+`state.q`, `state.aux`, and `state.patch` (level, delta, lower_global,
+upper_global, num_cells_global) are used.
+"""
+import os
+import collections
+
+
+# a patch: the attributes of pyclaw.Patch that post-processing scripts use
+Patch = collections.namedtuple(
+    "Patch", ["grid_number", "level", "num_cells_global", "delta",
+              "lower_global", "upper_global"])
+
+# a state: q and aux are (num_eqn or num_aux, mx, my) views without ghost cells
+State = collections.namedtuple("State", ["patch", "t", "q", "aux"])
+
+
+class Frame(collections.namedtuple("Frame", ["t", "states"])):
+    """A solution-like frame: `frame.states` and `frame.state.t`."""
+
+    __slots__ = ()
+
+    @property
+    def state(self):
+        """The first state, like `pyclaw.Solution.state`."""
+        return self.states[0]
+
+
+def read_t(out_path, frameno):
+    """Read fort.tNNNN; return a dict of t, num_eqn, num_patches, num_aux,
+    num_dim, and num_ghost."""
+
+    keys = ["t", "num_eqn", "num_patches", "num_aux", "num_dim", "num_ghost"]
+    with open(os.path.join(out_path, "fort.t{:04}".format(frameno)), "r") as f:
+        values = [line.split()[0] for line in f if line.strip()]
+
+    # older outputs do not have num_ghost
+    info = {"num_ghost": 2}
+    for key, value in zip(keys, values):
+        info[key] = float(value.upper().replace("D", "E")) if key == "t" else int(value)
+
+    return info
+
+def read_patch_headers(out_path, frameno):
+    """Read the patch headers in fort.qNNNN.
+
+    Returns a list of dicts with keys grid_number, level, mx, my, xlow, ylow,
+    dx, and dy, in the order the patches are stored in fort.bNNNN.
+    """
+
+    keys = ["grid_number", "level", "mx", "my", "xlow", "ylow", "dx", "dy"]
+    with open(os.path.join(out_path, "fort.q{:04}".format(frameno)), "r") as f:
+        values = [line.split()[0] for line in f if line.strip()]
+
+    headers = []
+    for i in range(0, len(values)-len(keys)+1, len(keys)):
+        header = {}
+        for j, key in enumerate(keys):
+            if j < 4:
+                header[key] = int(values[i+j])
+            else:
+                header[key] = float(values[i+j].upper().replace("D", "E"))
+        headers.append(header)
+
+    return headers
+
+def map_patches(filename, headers, nvars, num_ghost, selected):
+    """Map the selected patches of fort.bNNNN or fort.aNNNN into memory.
+
+    Each patch is stored as (nvars, mx+2*num_ghost, my+2*num_ghost) float64 in
+    Fortran order. Only the bytes from the first to the last selected patch are
+    mapped, and pages are read from disk only when they are touched. Returns a
+    list of read-only (nvars, mx, my) views without ghost cells.
+    """
+    import numpy
+
+    g = num_ghost
+    shapes = [(nvars, int(h["mx"])+2*g, int(h["my"])+2*g) for h in headers]
+    sizes = [nvars * shape[1] * shape[2] for shape in shapes]
+    offsets = [0] + list(numpy.cumsum(sizes, dtype=numpy.int64))
+
+    nbytes = os.path.getsize(filename)
+    if nbytes != 8 * offsets[-1]:
+        raise IOError("{} has {} bytes but {} are expected".format(filename, nbytes, 8*offsets[-1]))
+
+    if not selected:
+        return []
+
+    bg = int(offsets[selected[0]])
+    ed = int(offsets[selected[-1]+1])
+    data = numpy.memmap(filename, dtype=numpy.float64, mode="r", offset=8*bg, shape=(ed-bg,))
+
+    views = []
+    for i in selected:
+        shape = shapes[i]
+        view = data[offsets[i]-bg:offsets[i+1]-bg].reshape(shape, order="F")
+        views.append(view[:, g:shape[1]-g, g:shape[2]-g])
+
+    return views
+
+def read_frame(out_path, frameno, read_aux=False, index=None, levels=None, components=None):
+    """Read a frame without copying q and aux; return a Frame.
+
+    Arguments:
+        out_path: the output folder.
+        frameno: the frame number.
+        read_aux: whether to map fort.aNNNN, too.
+        index: an optional index from `frameindex.load_index`; patch headers
+            come from the index instead of fort.tNNNN and fort.qNNNN.
+        levels: an optional list of AMR levels; patches on other levels are
+            left out. GeoClaw writes patches level by level, so the bytes of
+            levels below or above the selected ones are not mapped at all.
+        components: an optional slice of q components, e.g., slice(0, 1) for
+            depth only. The components of a cell are stored next to each other,
+            so this does not reduce the bytes read from disk; it only gives
+            narrower views.
+    """
+
+    if index is None:
+        info = read_t(out_path, frameno)
+        headers = read_patch_headers(out_path, frameno)
+    else:
+        import frameindex
+        info, headers = frameindex.get_frame(index, frameno)
+
+    g = int(info["num_ghost"])
+    num_eqn = int(info["num_eqn"])
+    num_aux = int(info["num_aux"])
+    t = float(info["t"])
+
+    selected = [i for i, h in enumerate(headers) if levels is None or int(h["level"]) in levels]
+
+    q = map_patches(
+        os.path.join(out_path, "fort.b{:04}".format(frameno)), headers, num_eqn, g, selected)
+
+    if components is not None:
+        q = [qp[components] for qp in q]
+
+    if read_aux:
+        aux = map_patches(
+            os.path.join(out_path, "fort.a{:04}".format(frameno)), headers, num_aux, g, selected)
+    else:
+        aux = [None] * len(selected)
+
+    states = []
+    for i, qp, auxp in zip(selected, q, aux):
+        h = headers[i]
+        mx, my = int(h["mx"]), int(h["my"])
+        dx, dy = float(h["dx"]), float(h["dy"])
+        xlow, ylow = float(h["xlow"]), float(h["ylow"])
+        patch = Patch(
+            int(h["grid_number"]), int(h["level"]), [mx, my], [dx, dy],
+            [xlow, ylow], [xlow+mx*dx, ylow+my*dy])
+        states.append(State(patch, t, qp, auxp))
+
+    return Frame(t, states)
+
+def map_frames(func, cases, get_args, nprocs=None):
+    """Apply a function to chunks of frames of several cases with a pool of
+    processes.
+
+    Frames of each case are split into chunks of consecutive frames, about four
+    chunks per process in total so that the processes stay balanced, and the
+    chunks are submitted in the order of `cases` (e.g., the largest ones first).
+
+    Arguments:
+        func: a module-level function; func(*get_args(key, framenos)) returns a
+            list with one result per frame of a chunk.
+        cases: a dict of case key -> list of frame numbers.
+        get_args: a function returning the arguments of func for a chunk.
+        nprocs: number of processes; default to the number of CPUs.
+
+    Yields (key, dict of frame number -> result) of each case as soon as all
+    of its frames are done.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    nprocs = os.cpu_count() if nprocs is None else nprocs
+    total = sum([len(framenos) for framenos in cases.values()])
+    chunksize = max(1, total//(4*nprocs))
+
+    with ProcessPoolExecutor(nprocs) as pool:
+        futures = {}
+        results = {key: {} for key in cases}
+        remaining = {key: len(framenos) for key, framenos in cases.items()}
+        for key, framenos in cases.items():
+            for bg in range(0, len(framenos), chunksize):
+                chunk = list(framenos[bg:bg+chunksize])
+                futures[pool.submit(func, *get_args(key, chunk))] = (key, chunk)
+
+        for key in [key for key, n in remaining.items() if n == 0]:
+            yield key, results.pop(key)
+
+        for future in as_completed(futures):
+            key, chunk = futures[future]
+            results[key].update(zip(chunk, future.result()))
+
+            remaining[key] -= len(chunk)
+            if remaining[key] == 0:
+                yield key, results.pop(key)
+
+def benchmark_readers(casepath, framenos, repeats=3):
+    """Compare the time of reading frames and summing volumes with pyclaw and
+    with `read_frame`; return the best times (pyclaw, read_frame) in seconds."""
+    import time
+    import numpy
+    import caseinfo
+    from clawpack import pyclaw
+    from totalvolume import get_volumes_single_frame
+
+    out_path = os.path.join(os.path.abspath(casepath), "_output")
+    nlevels = caseinfo.get_case_info(casepath)["nlevels"]
+
+    def read_pyclaw(fno):
+        soln = pyclaw.Solution()
+        soln.read(fno, out_path, file_format="binary", read_aux=True)
+        return soln
+
+    def read_mmap(fno):
+        return read_frame(out_path, fno, read_aux=True)
+
+    best = []
+    results = []
+    for reader in [read_pyclaw, read_mmap]:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            volumes = [get_volumes_single_frame(nlevels, reader(fno)) for fno in framenos]
+            times.append(time.perf_counter()-start)
+        best.append(min(times))
+        results.append(volumes)
+
+    if not numpy.allclose(results[0], results[1], rtol=1e-14, atol=0.):
+        raise RuntimeError("Volumes from the two readers differ.")
+
+    return best[0], best[1]
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(
+        description="Benchmark read_frame against pyclaw.Solution.read.")
+
+    parser.add_argument(
+        '--case', dest='case', type=str, default="amr-tests/original",
+        help='case folder with _output (default: amr-tests/original)')
+
+    parser.add_argument(
+        '--frames', dest='frames', type=int, nargs="+", default=list(range(0, 361, 10)),
+        help='frame numbers to read (default: every 10th frame)')
+
+    parser.add_argument(
+        '--repeats', dest='repeats', type=int, default=3,
+        help='number of repeats; the best time is reported')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    t_pyclaw, t_mmap = benchmark_readers(args.case, args.frames, args.repeats)
+    print("pyclaw.Solution.read: {:.3f} s".format(t_pyclaw))
+    print("framereader.read_frame: {:.3f} s ({:.1f}x)".format(t_mmap, t_pyclaw/t_mmap))
@@ -0,0 +1,294 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Run cases, calculate volumes, and plot flows in an overlapped pipeline.
+
+Instead of waiting for all simulations to finish, this script watches the
+_output folder of each running case. As soon as a frame is complete, the frame
+is handed to the volume calculation and to the flow plotting, so the
+post-processing overlaps the simulations.
+"""
+import os
+import sys
+import time
+import logging
+import run
+import caseinfo
+import costmodel
+import watchdog
+import totalvolume
+import frameindex
+
+
+# logger
+logger = logging.getLogger("pipeline.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_pipeline.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+
+def get_ready_frames(out_path, nframes, finished):
+    """Get the frame numbers whose output files are completely written.
+
+    The solver writes fort.tNNNN after fort.qNNNN, fort.bNNNN, and fort.aNNNN,
+    so a frame is complete once fort.t of the next frame exists, or once the
+    simulation has finished.
+    """
+
+    def exists(prefix, fno):
+        return os.path.isfile(os.path.join(out_path, "{}{:04}".format(prefix, fno)))
+
+    ready = []
+    for fno in range(nframes):
+        if not all([exists(prefix, fno) for prefix in ["fort.t", "fort.q", "fort.b"]]):
+            continue
+        if finished or exists("fort.t", fno+1):
+            ready.append(fno)
+
+    return ready
+
+def plot_frame(casepath, frameno, nlevels, subtitle):
+    """Plot the depth of a frame on each level, like plotflow_cmd.py does."""
+    from plotflow_cmd import plot_single_frame
+
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    casename = os.path.relpath(casepath, repo_path)
+
+    for lvl in range(1, nlevels+1):
+        target = os.path.join(repo_path, "figs", casename, "level{:02}".format(lvl))
+        if not os.path.isdir(target):
+            os.makedirs(target, exist_ok=True)
+
+        plot_single_frame(
+            casepath, frameno, lvl, "{}/level {}".format(subtitle, lvl),
+            os.path.join(target, "depth{:04}.png".format(frameno)))
+
+def is_current(casepath, runhash):
+    """Check if the outputs of a case come from the current inputs."""
+
+    stamp = os.path.join(casepath, "_output", ".runhash")
+    if not os.path.isfile(stamp):
+        return False
+
+    with open(stamp, "r") as f:
+        return f.read().strip() == runhash
+
+def get_status_stamp(casepath):
+    """Get the inode and mtime of run_status.json of a case (None if missing).
+
+    `run.run_case` writes the status atomically with a new file once it has
+    removed or restored old outputs, so a changed stamp means the outputs of
+    the case are settled.
+    """
+
+    try:
+        st = os.stat(os.path.join(casepath, "run_status.json"))
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns)
+
+def run_pipeline(cases, nthreads, njobs, nprocs, poll=5, **kwargs):
+    """Run cases and post-process their frames as the frames come out.
+
+    Arguments:
+        cases: a list of (solver, casepath, subtitle).
+        nthreads: total number of OpenMP threads shared by running solvers.
+        njobs: number of cases running at the same time.
+        nprocs: number of processes for volume calculation and plotting.
+        poll: seconds between two scans of the output folders.
+
+    Extra keyword arguments are passed to `run.run_case`.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    start = time.perf_counter()
+
+    # frame and level numbers; longest-processing-time-first order
+    info = {}
+    for _, case, _ in cases:
+        meta = caseinfo.get_case_info(case)
+        info[case] = (meta["nframes"], meta["nlevels"])
+    costs, _ = costmodel.estimate_costs([case for _, case, _ in cases])
+    pending = [cases[i] for i in costmodel.lpt_order(costs)]
+
+    njobs = max(1, min(njobs, nthreads, len(cases)))
+    free = nthreads
+    sims = {} # case -> [future, nthreads, subtitle, hash of inputs, status stamp at launch]
+    dispatched = {case: set() for _, case, _ in cases}
+    volumes = {case: {} for _, case, _ in cases}
+    tasks = [] # (future, kind, case, frameno)
+    settled = set() # cases whose simulations returned before their last frame scan
+    finalized = set()
+
+    with ProcessPoolExecutor(njobs) as sim_pool, ProcessPoolExecutor(nprocs) as post_pool:
+        while len(finalized) < len(cases):
+
+            # launch simulations if there are free slots
+            nrunning = len([s for s in sims.values() if not s[0].done()])
+            while pending and nrunning < njobs:
+                nslots = min(njobs-nrunning, len(pending))
+                nt = max(1, free//nslots)
+                solver, case, subtitle = pending.pop(0)
+                logger.info("Launching case %s with %d threads", case, nt)
+                stamp = get_status_stamp(case)
+                sims[case] = [
+                    sim_pool.submit(run.run_case, solver, case, nt, **kwargs), nt, subtitle,
+                    run.get_run_hash(solver, case), stamp]
+                free -= nt
+                nrunning += 1
+
+            # hand newly completed frames to post-processing
+            for case, (future, nt, subtitle, runhash, stamp) in sims.items():
+                if case in finalized or case in settled:
+                    continue
+
+                finished = future.done()
+                if finished and nt:
+                    free += nt
+                    sims[case][1] = 0
+                    try:
+                        future.result() # raise if the simulation failed
+                    except watchdog.WatchdogAbort as err:
+                        logger.error("%s", err)
+                        finalized.add(case)
+                        continue
+                    logger.info("Simulation of case %s is done", case)
+
+                # run_case may still remove stale or incomplete outputs until it
+                # writes the status of this launch or returns
+                if not finished and get_status_stamp(case) == stamp:
+                    continue
+
+                if not is_current(case, runhash):
+                    if finished:
+                        logger.warning("Case %s has no outputs of the current inputs", case)
+                        finalized.add(case)
+                    continue
+
+                nframes, nlevels = info[case]
+                out_path = os.path.join(case, "_output")
+                for fno in get_ready_frames(out_path, nframes, finished):
+                    if fno in dispatched[case]:
+                        continue
+                    dispatched[case].add(fno)
+                    tasks.append((post_pool.submit(
+                        totalvolume.get_frame_volumes, out_path, fno, nlevels), "volume", case, fno))
+                    tasks.append((post_pool.submit(
+                        plot_frame, case, fno, nlevels, subtitle), "plot", case, fno))
+
+                # all frames on disk are dispatched, e.g., fewer than nframes
+                # if the case was aborted in an earlier launch
+                if finished:
+                    settled.add(case)
+
+            # collect finished post-processing tasks
+            remaining = []
+            for task in tasks:
+                future, kind, case, fno = task
+                if not future.done():
+                    remaining.append(task)
+                elif kind == "volume":
+                    volumes[case][fno] = future.result()
+                else:
+                    future.result()
+            tasks = remaining
+
+            # write the volume store once all frames of a finished case are reduced
+            for case in settled:
+                if case in finalized or any([t[2] == case for t in tasks]):
+                    continue
+
+                out_path = os.path.join(case, "_output")
+                if volumes[case]:
+                    totalvolume.save_volume_datafile(case, {
+                        fno: (frameindex.get_mtimes(out_path, fno)[:3], [t]+list(vols))
+                        for fno, (t, vols) in volumes[case].items()})
+
+                finalized.add(case)
+                logger.info("Case %s is done at %.1f s", case, time.perf_counter()-start)
+
+            time.sleep(poll)
+
+    logger.info("End-to-end time: %.1f s", time.perf_counter()-start)
+
+if __name__ == "__main__":
+    import argparse
+
+    # messages of run.py go to the file log of this script, too
+    run.logger.addHandler(fh)
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(
+        description="Run all cases with overlapped post-processing.")
+
+    parser.add_argument(
+        '--nthreads', dest='nthreads', type=int, default=os.cpu_count(),
+        help='total number of OpenMP threads shared by all running solvers')
+
+    parser.add_argument(
+        '--njobs', dest='njobs', type=int, default=1,
+        help='number of cases running at the same time')
+
+    parser.add_argument(
+        '--nprocs', dest='nprocs', type=int, default=1,
+        help='number of processes for volume calculation and plotting')
+
+    parser.add_argument(
+        '--cachedir', dest='cachedir', type=str, default=None,
+        help='keep a copy of finished outputs in this folder (default: no cache)')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    # solvers, cases, and subtitles of flow plots
+    cases = [
+        ("xgeoclaw.original", "amr-tests/original", "AMR/original"),
+        ("xgeoclaw.update", "amr-tests/fix_update", "AMR/new update.f90"),
+        ("xgeoclaw.flag2refine2", "amr-tests/fix_flag2refine2", "AMR/new flag2refine2.f90"),
+        ("xgeoclaw.update_and_flag2refine2", "amr-tests/fix_update_and_flag2refine2",
+         "AMR/new update.f90 & flag2refine2.f90"),
+        ("xgeoclaw.original", "single-mesh-tests/dx=4", "unifrom mesh/dx = 4"),
+        ("xgeoclaw.original", "single-mesh-tests/dx=2", "unifrom mesh/dx = 2"),
+        ("xgeoclaw.original", "single-mesh-tests/dx=1", "unifrom mesh/dx = 1"),
+        ("xgeoclaw.original", "single-mesh-tests/dx=0.5", "unifrom mesh/dx = 0.5"),
+        ("xgeoclaw.original", "single-mesh-tests/dx=0.25", "unifrom mesh/dx = 0.25"),
+        ("xgeoclaw.original", "single-mesh-tests/dx=0.125", "unifrom mesh/dx = 0.125")]
+
+    cases = [
+        (os.path.join(repo_path, "bin", solver), os.path.join(repo_path, case), subtitle)
+        for solver, case, subtitle in cases]
+
+    for _, case, _ in cases:
+        run.create_data(case, checkpt_interval=500)
+
+    run_pipeline(
+        cases, args.nthreads, args.njobs, args.nprocs,
+        cachedir=args.cachedir, checkpt_interval=500)
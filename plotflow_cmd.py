@@ -31,9 +31,12 @@ fh.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(mess
 # add handlers to the logger
 logger.addHandler(fh)
 
-def plot_single_frame(casepath, frameno, max_level, subtitle, outputfile):
-    """Plot flows of a single case."""
-    from clawpack import pyclaw
+def plot_single_frame(casepath, frameno, max_level, subtitle, outputfile, index=None):
+    """Plot flows of a single case.
+
+    `index` is an optional frame index from frameindex.load_index.
+    """
+    import framereader
 
     # paths
     casepath = os.path.abspath(casepath)
@@ -52,8 +55,8 @@ def plot_single_frame(casepath, frameno, max_level, subtitle, outputfile):
     main_ax = fig.add_axes([0.1, 0.38, 0.8, 0.52])
 
     # solution
-    soln = pyclaw.Solution()
-    soln.read(frameno, outputpath, file_format="binary", read_aux=True)
+    soln = framereader.read_frame(
+        outputpath, frameno, read_aux=True, index=index, levels=range(1, max_level+1))
 
     # plot topo first
     for lvl in range(1, max_level+1):
@@ -112,6 +115,7 @@ def plot_single_frame(casepath, frameno, max_level, subtitle, outputfile):
 
 def plot_case(casepath, casename, framelist, max_level, subtitle):
     """Plot frames in the framelist of a case."""
+    import frameindex
 
     # paths
     repo_path = os.path.dirname(os.path.abspath(__file__))
@@ -123,9 +127,12 @@ def plot_case(casepath, casename, framelist, max_level, subtitle):
     if not os.path.isdir(casefigpath):
         os.makedirs(casefigpath)
 
+    # patch headers of all frames, parsed only once
+    index = frameindex.load_index(os.path.join(casepath, "_output"))
+
     for fno in framelist:
         outputfile = os.path.join(casefigpath, "depth{:04}.png".format(fno))
-        plot_single_frame(casepath, fno, max_level, subtitle, outputfile)
+        plot_single_frame(casepath, fno, max_level, subtitle, outputfile, index)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,266 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Predict the wall time, memory, and disk footprint of cases before running them.
+
+Nothing is run. The setrun.py of every case is loaded, and
+
+    wall time: comes from the cost model (see costmodel.py);
+    output size: comes from the binary frame layout, assuming the worst-case
+        AMR coverage, i.e., every level covers the whole domain with patches
+        of at most max1d cells per side; a copy in the run cache and the two
+        alternating checkpoints of a running case, each holding q and aux of
+        all patches, are counted, too;
+    peak memory: counts the old and new q, aux, and per-thread work arrays of
+        the worst-case patches, or uses the peak memory in run_metrics.json
+        if the case has run before.
+
+The totals are compared with the free disk space and the available memory.
+"""
+import os
+import sys
+import json
+import logging
+import caseinfo
+import costmodel
+
+
+# logger
+logger = logging.getLogger("preflight.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_preflight.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+# maximum patch size per side (amrdata.max1d in AmrClaw)
+max1d = 60
+
+# bytes of a patch header in fort.q and of a fort.t file
+patch_header_bytes = 8 * 34 + 1
+t_file_bytes = 6 * 30
+
+
+def get_worst_patches(info):
+    """Worst-case patch sizes on each level: a list of lists of (mx, my)."""
+
+    nx, ny = info["num_cells"]
+    patches = []
+    for lvl in range(info["nlevels"]):
+        if lvl > 0:
+            rx, ry, _ = info["refinement_ratios"][lvl-1]
+            nx, ny = nx * rx, ny * ry
+
+        # split the level into patches no larger than max1d per side
+        px = [max1d] * (nx // max1d) + ([nx % max1d] if nx % max1d else [])
+        py = [max1d] * (ny // max1d) + ([ny % max1d] if ny % max1d else [])
+        patches.append([(mx, my) for mx in px for my in py])
+
+    return patches
+
+def predict_output_bytes(info):
+    """Predict the worst-case bytes of _output of a case.
+
+    fort.b holds num_eqn+1 components (GeoClaw appends the surface elevation)
+    and fort.a holds num_aux components of each patch, both with ghost cells,
+    in float64.
+    """
+
+    ng = info["num_ghost"]
+    nq = info["num_eqn"] + 1
+    na = info["num_aux"] if info["output_aux"] else 0
+
+    frame = t_file_bytes
+    for patches in get_worst_patches(info):
+        for mx, my in patches:
+            frame += patch_header_bytes + 8 * (nq + na) * (mx+2*ng) * (my+2*ng)
+
+    return frame * info["nframes"]
+
+def predict_checkpoint_bytes(info):
+    """Predict the worst-case bytes of a checkpoint file of a case.
+
+    A checkpoint holds q and aux of all patches, with ghost cells, in float64.
+    """
+
+    ng = info["num_ghost"]
+    nq = info["num_eqn"]
+    na = info["num_aux"]
+
+    nbytes = 0
+    for patches in get_worst_patches(info):
+        for mx, my in patches:
+            nbytes += 8 * (nq + na) * (mx+2*ng) * (my+2*ng)
+
+    return nbytes
+
+def predict_memory_bytes(info, nthreads):
+    """Predict the worst-case peak memory of a solver."""
+
+    ng = info["num_ghost"]
+    nq = info["num_eqn"]
+    na = info["num_aux"]
+
+    # old and new q and aux of all patches
+    storage = 0
+    for patches in get_worst_patches(info):
+        for mx, my in patches:
+            storage += 8 * (2*nq + na) * (mx+2*ng) * (my+2*ng)
+
+    # per-thread work arrays of a max1d patch: fluxes and 1D slices
+    work = nthreads * 8 * (4*nq + 10) * (max1d+2*ng)**2
+
+    # executable, OpenMP runtime, and buffers
+    overhead = 50 * 1048576
+
+    return storage + work + overhead
+
+def get_available_memory():
+    """Available memory in bytes from /proc/meminfo (or total physical memory)."""
+
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+def preflight(casepaths, nthreads, njobs=1, checkpt_interval=500, cachedir=None):
+    """Predict footprints of cases and check them against free resources.
+
+    With `checkpt_interval` (None for no checkpoints), the two checkpoint files
+    of each running case are counted until the case finishes and removes them;
+    with `cachedir`, a copy of every full output is counted (see
+    `run.run_case`).
+
+    Returns a list of per-case prediction dicts and whether everything fits.
+    """
+    import shutil
+
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    costs, _ = costmodel.estimate_costs(
+        casepaths, os.path.join(repo_path, "neck_test_timings.json"))
+
+    njobs = max(1, min(njobs, nthreads, len(casepaths)))
+    threads_per_job = max(1, nthreads // njobs)
+
+    predictions = []
+    for casepath, cost in zip(casepaths, costs):
+        info = caseinfo.get_case_info(casepath)
+        pred = {
+            "case": casepath,
+            "walltime": cost / threads_per_job,
+            "memory": predict_memory_bytes(info, threads_per_job),
+            "output": predict_output_bytes(info),
+            "checkpoint": 2 * predict_checkpoint_bytes(info) if checkpt_interval else 0}
+        pred["cache"] = pred["output"] if cachedir is not None else 0
+
+        # measured peak memory of an earlier run is better than a guess
+        metricsfile = os.path.join(casepath, "run_metrics.json")
+        if os.path.isfile(metricsfile):
+            with open(metricsfile, "r") as f:
+                pred["memory"] = json.load(f)["peak_rss"] or pred["memory"]
+
+        # outputs already on disk need no more space
+        out_path = os.path.join(casepath, "_output")
+        if os.path.isdir(out_path):
+            pred["output"] = max(0, pred["output"] - sum(
+                [os.path.getsize(os.path.join(out_path, f)) for f in os.listdir(out_path)]))
+
+        predictions.append(pred)
+        logger.info("%s: %.1f h, %.1f MiB memory, %.1f MiB more output, "
+                    "%.1f MiB checkpoints, %.1f MiB cache",
+                    os.path.relpath(casepath, repo_path), pred["walltime"]/3600,
+                    pred["memory"]/1048576, pred["output"]/1048576,
+                    pred["checkpoint"]/1048576, pred["cache"]/1048576)
+
+    disk_free = shutil.disk_usage(repo_path).free
+    mem_free = get_available_memory()
+    disk_need = sum([p["output"]+p["cache"] for p in predictions]) + \
+        sum(sorted([p["checkpoint"] for p in predictions], reverse=True)[:njobs])
+    mem_need = sum(sorted([p["memory"] for p in predictions], reverse=True)[:njobs])
+    _, makespan = costmodel.lpt_pack(costs, njobs)
+
+    logger.info("Predicted makespan with %d cases at a time: %.1f h",
+                njobs, makespan/threads_per_job/3600)
+    logger.info("Disk: %.1f GiB needed, %.1f GiB free", disk_need/2**30, disk_free/2**30)
+    logger.info("Memory: %.1f GiB needed, %.1f GiB available", mem_need/2**30, mem_free/2**30)
+
+    fits = True
+    if disk_need > disk_free:
+        logger.error("Outputs will not fit in the free disk space.")
+        fits = False
+    if mem_need > mem_free:
+        logger.error("The %d largest cases running together will not fit in memory.", njobs)
+        fits = False
+
+    return predictions, fits
+
+if __name__ == "__main__":
+    import argparse
+    import run
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(
+        description="Predict wall time, memory, and disk footprint of cases.")
+
+    parser.add_argument(
+        '--cases', dest='cases', type=str, nargs="+", default=None,
+        help='case folders (default: all cases run by run.py)')
+
+    parser.add_argument(
+        '--nthreads', dest='nthreads', type=int, default=os.cpu_count(),
+        help='total number of OpenMP threads shared by all running solvers')
+
+    parser.add_argument(
+        '--njobs', dest='njobs', type=int, default=1,
+        help='number of cases running at the same time')
+
+    parser.add_argument(
+        '--checkpt-interval', dest='checkpt_interval', type=int, default=500,
+        help='level-1 time steps between checkpoints; 0 disables checkpoints')
+
+    parser.add_argument(
+        '--cachedir', dest='cachedir', type=str, default=None,
+        help='the run cache folder, if the cases will be run with one')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    if args.cases is None:
+        cases = [case for _, case in run.get_all_jobs()]
+    else:
+        cases = [os.path.abspath(case) for case in args.cases]
+
+    _, fits = preflight(
+        cases, args.nthreads, args.njobs, args.checkpt_interval or None, args.cachedir)
+    sys.exit(0 if fits else 1)
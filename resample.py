@@ -0,0 +1,240 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Resample AMR frames onto uniform grids.
+
+Every uniform cell gets the value of the finest patches covering it. A patch
+coarser than the uniform grid is expanded with numpy.repeat, and the levels are
+painted from coarse to fine. A finer patch is summed over blocks of cells with
+a reshape when its cells line up with the uniform grid, or with numpy.bincount
+when they do not, and the uniform cell takes the area-weighted average.
+
+Resampled frames are cached in <case>/_resampled/dx=<dx>/ as .npy files and
+loaded as memory-mapped arrays. A cached frame is recomputed when its fort.b
+file is newer than the cache.
+"""
+import os
+import sys
+import logging
+import caseinfo
+import framereader
+
+
+# logger
+logger = logging.getLogger("resample.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_resample.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+
+def get_ratio(big, small):
+    """Get the integer ratio big/small; raise ValueError if it is not one."""
+
+    ratio = int(round(big/small))
+    if ratio < 1 or abs(ratio*small-big) > 1e-8 * big:
+        raise ValueError("{} is not an integer multiple of {}".format(big, small))
+
+    return ratio
+
+def sum_blocks(q, keep, i0, j0, ci, cj):
+    """Sum a patch's values over blocks of ci x cj cells, skipping cells where
+    `keep` is False.
+
+    (i0, j0) is the patch's lower corner in units of its own cells, counted
+    from the lower corner of the uniform grid. Returns the sums, the numbers of
+    cells summed in each block, and the uniform cell indices of the first block.
+    """
+    import numpy
+
+    nv, mx, my = q.shape
+    weights = keep.astype(numpy.float64)
+
+    # fast path: the patch covers whole uniform cells
+    if i0 % ci == 0 and j0 % cj == 0 and mx % ci == 0 and my % cj == 0:
+        sums = (q * weights).reshape(nv, mx//ci, ci, my//cj, cj).sum(axis=(2, 4))
+        counts = weights.reshape(mx//ci, ci, my//cj, cj).sum(axis=(1, 3))
+        return sums, counts, i0//ci, j0//cj
+
+    # general path: add each cell to the uniform cell containing it
+    ib, jb = i0 // ci, j0 // cj
+    nx, ny = -((-(i0+mx)) // ci) - ib, -((-(j0+my)) // cj) - jb
+    ii = (numpy.arange(i0, i0+mx) // ci - ib)[:, None]
+    jj = (numpy.arange(j0, j0+my) // cj - jb)[None, :]
+    flat = (ii * ny + jj).ravel()
+
+    counts = numpy.bincount(flat, weights.ravel(), nx*ny).reshape(nx, ny)
+    sums = numpy.zeros((nv, nx, ny), dtype=numpy.float64)
+    for m in range(nv):
+        sums[m] = numpy.bincount(flat, (q[m]*weights).ravel(), nx*ny).reshape(nx, ny)
+
+    return sums, counts, ib, jb
+
+def resample_frame(frame, lower, upper, dx, dy=None):
+    """Resample a frame onto a uniform grid with cell size dx by dy.
+
+    Patches at least as coarse as the uniform grid are painted with numpy.repeat
+    from coarse to fine levels. Cells of finer patches that are not covered by
+    even finer patches are then summed into the uniform cells, and each uniform
+    cell gets the area-weighted average of the finest data over it.
+
+    Arguments:
+        frame: a frame from framereader.read_frame (or a pyclaw Solution).
+        lower, upper: [x, y] of the corners of the uniform grid.
+        dx, dy: cell sizes of the uniform grid; dy defaults to dx.
+
+    Returns an array of shape (ncomponents, nx, ny); cells not covered by any
+    patch are NaN.
+    """
+    import numpy
+    import totalvolume
+
+    dy = dx if dy is None else dy
+    nx = get_ratio(upper[0]-lower[0], dx)
+    ny = get_ratio(upper[1]-lower[1], dy)
+    nv = frame.states[0].q.shape[0]
+
+    grid = numpy.full((nv, nx, ny), numpy.nan, dtype=numpy.float64)
+
+    # coarse levels first, so finer patches overwrite them
+    fine = []
+    for state in sorted(frame.states, key=lambda s: s.patch.level):
+        p = state.patch
+        if p.delta[0] < dx or p.delta[1] < dy:
+            fine.append(state)
+            continue
+
+        mx, my = p.num_cells_global
+        rx, ry = get_ratio(p.delta[0], dx), get_ratio(p.delta[1], dy)
+        i0 = int(round((p.lower_global[0]-lower[0])/dx))
+        j0 = int(round((p.lower_global[1]-lower[1])/dy))
+        values = numpy.repeat(numpy.repeat(state.q, rx, axis=1), ry, axis=2)
+        ib, jb = max(i0, 0), max(j0, 0)
+        ie, je = min(i0+mx*rx, nx), min(j0+my*ry, ny)
+        grid[:, ib:ie, jb:je] = values[:, ib-i0:ie-i0, jb-j0:je-j0]
+
+    if not fine:
+        return grid
+
+    # integrals and areas of the finest data from patches finer than the grid
+    masks = dict(zip([id(s) for s in frame.states], totalvolume.get_coverage_masks(frame)))
+    fine_sum = numpy.zeros((nv, nx, ny), dtype=numpy.float64)
+    fine_area = numpy.zeros((nx, ny), dtype=numpy.float64)
+    for state in fine:
+        p = state.patch
+        ci, cj = get_ratio(dx, p.delta[0]), get_ratio(dy, p.delta[1])
+        i0 = int(round((p.lower_global[0]-lower[0])/p.delta[0]))
+        j0 = int(round((p.lower_global[1]-lower[1])/p.delta[1]))
+        sums, counts, ib, jb = sum_blocks(
+            numpy.asarray(state.q), ~masks[id(state)], i0, j0, ci, cj)
+
+        ie, je = ib + counts.shape[0], jb + counts.shape[1]
+        src = (slice(max(ib, 0)-ib, min(ie, nx)-ib), slice(max(jb, 0)-jb, min(je, ny)-jb))
+        dst = (slice(max(ib, 0), min(ie, nx)), slice(max(jb, 0), min(je, ny)))
+        area = p.delta[0] * p.delta[1]
+        fine_sum[(slice(None),)+dst] += sums[(slice(None),)+src] * area
+        fine_area[dst] += counts[src] * area
+
+    # the rest of each uniform cell keeps the value painted from coarser levels
+    cell_area = dx * dy
+    covered = fine_area >= cell_area * (1. - 1e-10)
+    touched = fine_area > 0.
+    mixed = touched & ~covered
+    grid[:, covered] = fine_sum[:, covered] / fine_area[covered]
+    grid[:, mixed] = (grid[:, mixed] * (cell_area - fine_area[mixed]) + fine_sum[:, mixed]) / cell_area
+
+    return grid
+
+def get_cache_file(casepath, frameno, dx, components):
+    """The cache file of a resampled frame."""
+
+    return os.path.join(
+        os.path.abspath(casepath), "_resampled", "dx={:g}".format(dx),
+        "q{}-{}_{:04}.npy".format(components.start or 0, components.stop, frameno))
+
+def get_resampled(casepath, frameno, dx, components=slice(0, 3), index=None):
+    """Get a frame of a case resampled onto the uniform grid with cell size dx.
+
+    The uniform grid covers the domain in setrun.py. The result is cached and
+    returned as a read-only memory-mapped array of shape (ncomponents, nx, ny);
+    by default, the components are depth and x/y momentum.
+    """
+    import numpy
+
+    casepath = os.path.abspath(casepath)
+    out_path = os.path.join(casepath, "_output")
+    cachefile = get_cache_file(casepath, frameno, dx, components)
+    datafile = os.path.join(out_path, "fort.b{:04}".format(frameno))
+
+    if os.path.isfile(cachefile) and os.path.getmtime(cachefile) >= os.path.getmtime(datafile):
+        return numpy.load(cachefile, mmap_mode="r")
+
+    info = caseinfo.get_case_info(casepath)
+    frame = framereader.read_frame(out_path, frameno, index=index, components=components)
+    grid = resample_frame(frame, info["lower"], info["upper"], dx)
+
+    # write to a temporary file and rename, so readers never see a partial file
+    os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+    tmpfile = "{}.{}.tmp".format(cachefile, os.getpid())
+    with open(tmpfile, "wb") as f:
+        numpy.save(f, grid)
+    os.replace(tmpfile, cachefile)
+
+    logger.debug("Resampled frame %d of %s with dx=%s", frameno, casepath, dx)
+
+    return numpy.load(cachefile, mmap_mode="r")
+
+if __name__ == "__main__":
+    import argparse
+    import frameindex
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(description="Resample frames onto a uniform grid.")
+
+    parser.add_argument(
+        '--case', dest='case', type=str, required=True, help='case folder')
+
+    parser.add_argument(
+        '--dx', dest='dx', type=float, required=True, help='cell size of the uniform grid')
+
+    parser.add_argument(
+        '--frames', dest='frames', type=int, nargs="+", default=None,
+        help='frame numbers (default: all)')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    index = frameindex.load_index(os.path.join(args.case, "_output"))
+    frames = index.frames["frame"].tolist() if args.frames is None else args.frames
+
+    for fno in frames:
+        get_resampled(args.case, fno, args.dx, index=index)
+
+    logger.info("Done resampling %d frames of %s", len(frames), args.case)
@@ -12,6 +12,10 @@ Run all cases.
 import os
 import sys
 import logging
+import caseinfo
+import costmodel
+import staging
+import watchdog
 
 
 # logger
@@ -22,19 +26,24 @@ logger.setLevel(logging.DEBUG)
 ch = logging.StreamHandler()
 ch.setLevel(logging.INFO)
 
-# file log
-fh = logging.FileHandler("neck_test_run.log", "w", "utf-8")
-fh.setLevel(logging.DEBUG)
-fh.setFormatter(logging.Formatter(
-    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
-
-# add handlers to the logger
+# add handlers to the logger; the file log is only added when this file runs
+# as a script, so modules importing it do not truncate neck_test_run.log
 logger.addHandler(ch)
-logger.addHandler(fh)
 
 
-def create_data(casepath):
-    """Create *.data files in a case folder."""
+def create_data(casepath, out_dir=None, checkpt_interval=None, restart_file=None):
+    """Create *.data files in a case folder.
+
+    Arguments:
+        casepath: the case folder containing setrun.py.
+        out_dir: where to write *.data files (default: the case folder).
+        checkpt_interval: if given, write a checkpoint every checkpt_interval
+            level-1 time steps, alternating between fort.chkaaaaa and
+            fort.chkbbbbb (i.e., clawdata.checkpt_style = -3), so only the two
+            newest checkpoints are on disk.
+        restart_file: if given, restart from this checkpoint file, which must
+            be in the folder the solver runs in.
+    """
 
     if not os.path.isdir(casepath):
         logger.error("Case folder %s not found.", casepath)
@@ -45,47 +54,207 @@ def create_data(casepath):
         logger.error("Case folder %s does not have setrun.py.", casepath)
         raise FileNotFoundError("Case folder {} does not have setrun.py.".format(casepath))
 
-    pwd = os.getcwd() # get current working directory
-    os.chdir(casepath) # go to case folder
+    rundata = caseinfo.load_rundata(casepath) # get ClawRunData object
+
+    if checkpt_interval is not None:
+        rundata.clawdata.checkpt_style = -3
+        rundata.clawdata.checkpt_interval = checkpt_interval
+
+    if restart_file is not None:
+        rundata.clawdata.restart = True
+        rundata.clawdata.restart_file = restart_file
+        rundata.clawdata.output_t0 = False # the frame at restart time exists
 
+    # write *.data to the case folder or out_dir
+    rundata.write(out_dir=casepath if out_dir is None else out_dir)
+
+def get_run_hash(solver, casepath):
+    """Hash the inputs of a run: *.data files, solver, and topodata/topo.asc.
+
+    The absolute paths in *.data files are hashed relative to the repository,
+    so hosts mounting the repository at different paths get the same hash.
+    The checkpoint settings in claw.data are left out: they do not change the
+    results, so changing the checkpoint cadence does not trigger new runs.
+    """
+    import re
+    import glob
+    import hashlib
 
-    if casepath != sys.path[0]:
-        sys.path.insert(0, casepath) # add case folder to module search path
-    import setrun # import the setrun.py
-    rundata = setrun.setrun() # get ClawRunData object
-    rundata.write() # write *.data to the case folder
-    del rundata
-    del sys.modules["setrun"]
-    del sys.path[0]
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    topofile = os.path.join(repo_path, "topodata", "topo.asc")
+
+    for fname in [solver, topofile]:
+        if not os.path.isfile(fname):
+            logger.error("Input file %s of case %s not found.", fname, casepath)
+            raise FileNotFoundError("Input file {} of case {} not found.".format(fname, casepath))
+
+    sha = hashlib.sha256()
+    for fname in sorted(glob.glob(os.path.join(casepath, "*.data"))):
+        sha.update(os.path.basename(fname).encode("utf-8"))
+        with open(fname, "rb") as f:
+            data = f.read().replace(repo_path.encode("utf-8"), b"<repo>")
+        sha.update(re.sub(rb"(?m)^.*=:\s*(checkpt_\w+|num_checkpt_times)\s*\n", b"", data))
+
+    for fname in [solver, topofile]:
+        sha.update(os.path.basename(fname).encode("utf-8"))
+        with open(fname, "rb") as f:
+            for chunk in iter(lambda: f.read(1048576), b""):
+                sha.update(chunk)
+
+    return sha.hexdigest()
+
+def get_output_usage(out_path):
+    """Get the total bytes and the file counts per kind in an output folder.
+
+    Files are grouped by their names without frame/step numbers, e.g., all
+    fort.qNNNN files are counted under fort.q.
+    """
+    import re
+
+    nbytes = 0
+    counts = {}
+    for fname in os.listdir(out_path):
+        fpath = os.path.join(out_path, fname)
+        if not os.path.isfile(fpath):
+            continue
+        nbytes += os.path.getsize(fpath)
+        kind = re.sub(r"[0-9]+$", "", fname)
+        counts[kind] = counts.get(kind, 0) + 1
+
+    return nbytes, counts
+
+def get_checkpoint_time(tckfile):
+    """Read the time of a checkpoint from its time stamp file; None if unknown."""
+    import re
 
-    os.chdir(pwd) # go back to pwd
+    try:
+        with open(tckfile, "r") as f:
+            match = re.search(r"t\s*=\s*(\S+)", f.readline())
+        return float(match.group(1).upper().replace("D", "E"))
+    except (OSError, AttributeError, ValueError):
+        return None
+
+def get_latest_checkpoint(out_path):
+    """Get the name of the newest complete checkpoint file in out_path.
+
+    Checkpoints are fort.chkaaaaa and fort.chkbbbbb when the solver alternates
+    between two files, or fort.chkNNNNN otherwise. A checkpoint is complete
+    once the solver has written its time stamp file (fort.tckaaaaa, etc.), and
+    the newest one is that with the latest time in its time stamp file.
+    Returns None if there is no complete checkpoint.
+    """
+    import re
+
+    candidates = []
+    for chkfile in os.listdir(out_path):
+        if not re.match(r"^fort\.chk([0-9]{5}|aaaaa|bbbbb)$", chkfile):
+            continue
+
+        tckfile = os.path.join(out_path, chkfile.replace("chk", "tck"))
+        if not os.path.isfile(tckfile):
+            continue
+
+        # time stamp files that cannot be parsed go last, then by mtime
+        t = get_checkpoint_time(tckfile)
+        candidates.append(((t is not None, t or 0., os.path.getmtime(tckfile)), chkfile))
+
+    if not candidates:
+        return None
+
+    return max(candidates)[1]
+
+def _copy_tree(src, dst):
+    """Copy all files in src to a new folder dst.
+
+    Files are copied rather than hard-linked, so rewriting a file in one folder
+    later does not change the other. The copy goes to a temporary folder that
+    is renamed to dst at the end, so dst never holds a partial copy.
+    """
+    import shutil
 
-def run_case(solver, casepath):
-    """Run a single case with specified solver."""
+    tmp = "{}.{}.tmp".format(dst, os.getpid())
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+
+    os.makedirs(tmp)
+    for fname in os.listdir(src):
+        if os.path.isfile(os.path.join(src, fname)):
+            shutil.copy2(os.path.join(src, fname), os.path.join(tmp, fname))
+    os.rename(tmp, dst)
+
+def run_case(solver, casepath, nthreads=None, cachedir=None, criteria=None, scratch=None,
+             checkpt_interval=None):
+    """Run a single case with specified solver.
+
+    If `nthreads` is given, the solver is launched with OMP_NUM_THREADS set to
+    it; otherwise the child inherits the current environment.
+
+    An incomplete case resumes from its newest checkpoint and keeps writing
+    checkpoints every `checkpt_interval` level-1 time steps (None to disable);
+    use the interval its *.data files were created with (see `create_data`).
+
+    If `cachedir` is given, finished outputs are kept there under the hash of
+    the run inputs (see `get_run_hash`). A run whose hash is in the cache is
+    restored from it instead of being simulated again.
+
+    The solver is watched by `watchdog.watch` with the abort `criteria` (see
+    watchdog.py), and its final status is written to run_status.json in the
+    case folder. Wall time, CPU times, peak memory, and the bytes and files in
+    _output of the run are written to run_metrics.json. A case killed by the watchdog raises
+    `watchdog.WatchdogAbort` and is skipped later until its inputs change.
+
+    Returns False if the case is skipped because it is already done, and True
+    otherwise.
+    """
+    import json
     import shutil
     import glob
+    import tempfile
+    import threading
     import subprocess
 
     solver = os.path.abspath(solver)
     casepath = os.path.abspath(casepath)
     out_path = os.path.join(casepath, "_output")
+    stamp = os.path.join(out_path, ".runhash")
+    statusfile = os.path.join(casepath, "run_status.json")
+
+    restart_file = None
+    oldhash = None
 
     logger.info("Preparing to run case %s", casepath)
-    if os.path.isdir(out_path):
+    runhash = get_run_hash(solver, casepath)
+    logger.debug("Hash of the inputs of case %s: %s", casepath, runhash)
+
+    # a run killed by the watchdog is not tried again with the same inputs
+    if os.path.isfile(statusfile):
+        with open(statusfile, "r") as f:
+            status = json.load(f)
+        if status["status"] == "aborted" and status["hash"] == runhash:
+            logger.warning("Case %s was aborted (%s). Skip it", casepath, status["reason"])
+            return False
+
+    # outputs from different inputs are out of date; outputs without a stamp,
+    # e.g., from runs before stamps existed, come from unknown inputs
+    if os.path.isfile(stamp):
+        with open(stamp, "r") as f:
+            oldhash = f.read().strip()
+
+        if oldhash != runhash:
+            logger.warning("Outputs of case %s are out of date. Remove them.", casepath)
+            shutil.rmtree(out_path)
+
+    # restore outputs from the cache
+    if cachedir is not None and not os.path.isdir(out_path):
+        cached = os.path.join(cachedir, runhash)
+        if os.path.isdir(cached):
+            logger.info("Restore outputs of case %s from %s", casepath, cached)
+            _copy_tree(cached, out_path)
+            return False
 
-        # if casepath not in sys.path, add it
-        if casepath != sys.path[0]:
-            print(sys.path[0])
-            sys.path.insert(0, casepath) # add case folder to module search path
-        print(sys.path[0])
+    if os.path.isdir(out_path):
 
-        # get rundata
-        import setrun
-        rundata = setrun.setrun()
-        nframes = rundata.clawdata.num_output_times+1
-        del rundata
-        del sys.modules["setrun"]
-        del sys.path[0]
+        nframes = caseinfo.get_case_info(casepath)["nframes"]
 
         nfiles = [
             len(glob.glob(os.path.join(out_path, "fort.t"+"[0-9]"*4))),
@@ -96,61 +265,303 @@ def run_case(solver, casepath):
         # check if this case is already completed
         if all([n == nframes for n in nfiles]):
             logger.warning("Case %s seems to be already done. Skip it", casepath)
-            return
-
-        logger.warning("Case %s is not complete. Remove outputs and re-run.", casepath)
-        shutil.rmtree(out_path)
-
-    # make the output folder
-    os.makedirs(out_path)
-
-    # copy data files to output folder
-    datafiles = glob.glob(os.path.join(casepath, "*.data"))
-    for datafile in datafiles:
-        base = os.path.basename(datafile)
-        shutil.copyfile(datafile, os.path.join(out_path, base))
-
-    # change directory to output directory
-    orig_dir = os.getcwd()
-    os.chdir(out_path)
+            if oldhash is None: # take complete outputs as from the current inputs
+                with open(stamp, "w") as f:
+                    f.write(runhash)
+            return False
+
+        # checkpoints from unknown inputs are not trusted
+        if oldhash is not None:
+            restart_file = get_latest_checkpoint(out_path)
+        if restart_file is None:
+            logger.warning("Case %s is not complete. Remove outputs and re-run.", casepath)
+            shutil.rmtree(out_path)
+        else:
+            logger.warning("Case %s is not complete. Restart from %s.", casepath, restart_file)
+
+    if not os.path.isdir(out_path):
+
+        # make the output folder
+        os.makedirs(out_path)
+
+        # copy data files to output folder
+        datafiles = glob.glob(os.path.join(casepath, "*.data"))
+        for datafile in datafiles:
+            base = os.path.basename(datafile)
+            shutil.copyfile(datafile, os.path.join(out_path, base))
+
+        # stamp the outputs with the hash of the inputs
+        with open(stamp, "w") as f:
+            f.write(runhash)
+    else:
+        # data files in the output folder tell the solver to restart
+        create_data(casepath, out_path, checkpt_interval, restart_file)
 
     # run simulation
     logger.info("Runngin case %s", casepath)
     logger.info("STDOUT is redirected to %s", os.path.join(casepath, "stdout.txt"))
     logger.info("STDERR is redirected to %s", os.path.join(casepath, "stderr.txt"))
-    stdout = open(os.path.join(casepath, "stdout.txt"), "w")
-    stderr = open(os.path.join(casepath, "stderr.txt"), "w")
-
-    job = subprocess.run([solver], stdout=stdout, stderr=stderr)
-
-    stdout.close()
-    stderr.close()
-
+    mode = "w" if restart_file is None else "a" # keep logs of previous attempts
+    stdout = open(os.path.join(casepath, "stdout.txt"), mode)
+    stderr = open(os.path.join(casepath, "stderr.txt"), mode)
+
+    # OpenMP threads used by this solver
+    env = os.environ.copy()
+    if nthreads is not None:
+        env["OMP_NUM_THREADS"] = str(nthreads)
+        logger.info("Case %s uses %d OpenMP threads", casepath, nthreads)
+
+    status = {"case": casepath, "hash": runhash, "status": "running"}
+    watchdog.write_status(statusfile, status)
+
+    # the solver runs in the output directory or in a scratch directory
+    run_path = out_path
+    publisher = None
+    job = None
     try:
-        job.check_returncode()
-    except subprocess.CalledProcessError:
-        logger.error(job.stderr.decode("UTF-8"))
+        if scratch is not None:
+            os.makedirs(scratch, exist_ok=True)
+            run_path = tempfile.mkdtemp(prefix=os.path.basename(casepath)+".", dir=scratch)
+            staging.stage_inputs(out_path, run_path, restart_file)
+            logger.info("Case %s runs in scratch directory %s", casepath, run_path)
+
+            # publish finished frames to the output directory in the background
+            published = set()
+            stop = threading.Event()
+            publisher = threading.Thread(
+                target=staging.publish_loop, args=(run_path, out_path, published, stop),
+                daemon=True)
+            publisher.start()
+
+        job = subprocess.Popen([solver], stdout=stdout, stderr=stderr, env=env, cwd=run_path)
+        # after a restart, a scratch folder only has the frames since the
+        # restart, while out_path has all of them
+        status.update(watchdog.watch(job, stdout.name, out_path, criteria))
+    finally:
+        stdout.close()
+        stderr.close()
+
+        # a solver left running by an exception is not left behind
+        if job is not None and job.returncode is None:
+            job.kill()
+            job.wait()
+
+        if publisher is not None:
+            stop.set()
+            publisher.join()
+
+            # the last frame is only complete if the solver finished normally
+            finished = job is not None and job.returncode == 0 and status.get("reason") is None
+            staging.publish_ready(run_path, out_path, published, finished=finished)
+
+        if run_path != out_path:
+            shutil.rmtree(run_path)
+
+    if status["reason"] is not None:
+        status["status"] = "aborted"
+    elif job.returncode != 0:
+        status["status"] = "failed"
+    else:
+        status["status"] = "finished"
+    watchdog.write_status(statusfile, status)
+
+    # resource usage of this run
+    nbytes, counts = get_output_usage(out_path)
+    metrics = {
+        "case": casepath, "solver": solver, "status": status["status"],
+        "nthreads": nthreads, "restart_file": restart_file,
+        "walltime": status["walltime"], "user_time": status["user_time"],
+        "sys_time": status["sys_time"], "peak_rss": status["peak_rss"],
+        "output_bytes": nbytes, "output_files": counts}
+    with open(os.path.join(casepath, "run_metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=1)
+    logger.info("Case %s: wall %.1f s, user %.1f s, sys %.1f s, peak RSS %.1f MiB, "
+                "%.1f MiB in %d output files", casepath, metrics["walltime"],
+                metrics["user_time"], metrics["sys_time"], metrics["peak_rss"]/1048576,
+                nbytes/1048576, sum(counts.values()))
+
+    if status["status"] == "aborted":
+        logger.error("Simulation case %s aborted: %s", casepath, status["reason"])
+        raise watchdog.WatchdogAbort(
+            "Case {} aborted: {}".format(casepath, status["reason"]))
+
+    if status["status"] == "failed":
+        logger.error("See %s for error messages.", stderr.name)
         logger.error("Simulation case %s failed. Exit.", casepath)
-        raise
+        raise subprocess.CalledProcessError(job.returncode, solver)
 
     logger.info("Finished case %s", casepath)
 
-    # go back to the original directory
-    os.chdir(orig_dir)
-
-def run_all():
-    """Run all cases."""
+    # checkpoints are not needed once the case is done
+    for fname in glob.glob(os.path.join(out_path, "fort.[ct][hc]k?????")):
+        os.remove(fname)
+
+    # save the outputs in the cache
+    if cachedir is not None:
+        cached = os.path.join(cachedir, runhash)
+        if os.path.isdir(cached):
+            shutil.rmtree(cached)
+        logger.info("Save outputs of case %s to %s", casepath, cached)
+        _copy_tree(out_path, cached)
+
+    return True
+
+def run_case_timed(solver, casepath, nthreads=None, **kwargs):
+    """Run a single case and return its wall time in seconds (None if skipped).
+
+    Extra keyword arguments are passed to `run_case`.
+    """
+    import time
+
+    start = time.perf_counter()
+    if not run_case(solver, casepath, nthreads, **kwargs):
+        return None
+    return time.perf_counter() - start
+
+def run_concurrent(jobs, nthreads, njobs, **kwargs):
+    """Run (solver, casepath) pairs concurrently under a total thread budget.
+
+    At most `njobs` solvers run at the same time. When a solver is launched,
+    it gets an equal share of the threads not used by the solvers already
+    running; this thread count is fixed for the whole run, i.e., running
+    solvers do not get the threads of solvers that finish.
+
+    Cases are launched in the given order, so passing them in
+    longest-processing-time-first order gives the LPT list schedule.
+
+    Extra keyword arguments are passed to `run_case`.
+
+    Returns dicts of wall times and thread counts keyed by case path (skipped
+    cases excluded), and the makespan.
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    njobs = max(1, min(njobs, nthreads, len(jobs)))
+    pending = list(jobs)
+    running = {}
+    walltimes = {}
+    threads = {}
+    free = nthreads
+
+    logger.info("Running %d cases, %d at a time, with %d threads in total",
+                len(jobs), njobs, nthreads)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(njobs) as executor:
+        while pending or running:
+
+            # launch as many cases as the free slots allow
+            while pending and len(running) < njobs:
+                nslots = min(njobs-len(running), len(pending))
+                nt = max(1, free//nslots)
+                solver, case = pending.pop(0)
+                future = executor.submit(run_case_timed, solver, case, nt, **kwargs)
+                running[future] = (case, nt)
+                free -= nt
+
+            # wait for any case to finish and give its threads back
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                case, nt = running.pop(future)
+                free += nt
+                try:
+                    walltime = future.result()
+                except watchdog.WatchdogAbort as err:
+                    logger.error("%s", err)
+                    continue
+                if walltime is None:
+                    continue
+                walltimes[case] = walltime
+                threads[case] = nt
+                logger.info("Case %s took %.1f s with %d threads",
+                            case, walltime, nt)
+
+    makespan = time.perf_counter() - start
+
+    # the wall times are measured while the cases share the threads, so their
+    # sum is not the time of running the cases one after another
+    logger.info("Makespan: %.1f s; sum of concurrent case wall times: %.1f s",
+                makespan, sum(walltimes.values()))
+
+    return walltimes, threads, makespan
+
+def run_jobs(jobs, nthreads=None, njobs=1, checkpt_interval=500, criteria=None, scratch=None,
+             cachedir=None):
+    """Create data files of and run (solver, casepath) pairs.
+
+    `nthreads` is the total number of OpenMP threads shared by all running
+    solvers (default: OMP_NUM_THREADS or the number of CPUs), and `njobs` is
+    the number of cases running at the same time. Solvers write a checkpoint
+    every `checkpt_interval` level-1 time steps (None to disable), so an
+    interrupted case resumes from its newest checkpoint. `criteria` are the
+    watchdog's abort criteria (see watchdog.py). If `scratch` is given, solvers
+    run in temporary folders under it, and if `cachedir` is given, finished
+    outputs are copied there (see `run_case`).
+
+    Cases are launched in longest-processing-time-first order from the cost
+    model, and their wall times are recorded to refine the model.
+    """
+    import json
+    from concurrent.futures import ThreadPoolExecutor
 
-    # paths
     repo_path = os.path.dirname(os.path.abspath(__file__))
-    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
 
-    # add environment variables
-    os.environ["CLAW"] = claw_path
+    if nthreads is None:
+        try:
+            nthreads = int(os.environ["OMP_NUM_THREADS"])
+        except KeyError:
+            nthreads = os.cpu_count()
+
+    # create *.data files of all cases concurrently
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(
+            lambda job: create_data(job[1], checkpt_interval=checkpt_interval), jobs))
+
+    # longest-processing-time-first order from the cost model
+    timingdb = os.path.join(repo_path, "neck_test_timings.json")
+    costs, features = costmodel.estimate_costs([job[1] for job in jobs], timingdb)
+    order = costmodel.lpt_order(costs)
+    for i in order:
+        logger.info("Estimated cost of case %s: %.1f thread-seconds", jobs[i][1], costs[i])
+
+    nslots = max(1, min(njobs, nthreads, len(jobs)))
+    _, load = costmodel.lpt_pack(costs, nslots)
+    logger.info("Predicted makespan: %.1f s", load/max(1, nthreads//nslots))
+
+    # run simulations
+    walltimes, threads, makespan = run_concurrent(
+        [jobs[i] for i in order], nthreads, njobs,
+        cachedir=cachedir, criteria=criteria,
+        scratch=scratch, checkpt_interval=checkpt_interval)
+
+    # the baseline is predicted, not measured: the cost model's time of running
+    # the same cases one after another, each with all the threads
+    baseline = sum([costs[i] for i in order if jobs[i][1] in walltimes]) / nthreads
+    logger.info("Makespan: %.1f s; sequential baseline (cost model, one case at a time "
+                "with %d threads): %.1f s", makespan, nthreads, baseline)
+
+    # record measured wall times to refine the cost model; a resumed run only
+    # covers the time after its checkpoint, so its wall time is left out
+    resumed = []
+    for case in walltimes:
+        with open(os.path.join(case, "run_metrics.json"), "r") as f:
+            if json.load(f)["restart_file"] is not None:
+                resumed.append(case)
+                logger.info("Case %s resumed from a checkpoint; wall time not recorded", case)
+
+    costmodel.record_timings(timingdb, [
+        {"case": os.path.relpath(jobs[i][1], repo_path),
+         "solver": os.path.basename(jobs[i][0]),
+         "nthreads": threads[jobs[i][1]],
+         "walltime": walltimes[jobs[i][1]],
+         "features": features[i]} for i in order
+        if jobs[i][1] in walltimes and jobs[i][1] not in resumed])
+
+def get_all_jobs():
+    """Get the (solver, casepath) pairs of all cases in this repository."""
 
-    # add clawpack python package search path
-    if claw_path != sys.path[0]:
-        sys.path.insert(0, claw_path)
+    repo_path = os.path.dirname(os.path.abspath(__file__))
 
     # cases and corresponding solvers
     solver_cases = {
@@ -166,16 +577,78 @@ def run_all():
             "single-mesh-tests/dx=0.25",
             "single-mesh-tests/dx=0.125"]}
 
+    jobs = []
     for solver, cases in solver_cases.items():
         for case in cases:
-            solver = os.path.join(repo_path, "bin", solver)
-            case = os.path.join(repo_path, case)
+            jobs.append((os.path.join(repo_path, "bin", solver), os.path.join(repo_path, case)))
+
+    return jobs
+
+def run_all(nthreads=None, njobs=1, checkpt_interval=500, criteria=None, scratch=None,
+            cachedir=None):
+    """Run all cases. See `run_jobs` for the arguments."""
 
-            # create *.data files
-            create_data(case)
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
 
-            # run simulation
-            run_case(solver, case)
+    run_jobs(get_all_jobs(), nthreads, njobs, checkpt_interval, criteria, scratch, cachedir)
 
 if __name__ == "__main__":
-    run_all()
+    import argparse
+
+    # file log
+    fh = logging.FileHandler("neck_test_run.log", "w", "utf-8")
+    fh.setLevel(logging.DEBUG)
+    fh.setFormatter(logging.Formatter(
+        '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+    logger.addHandler(fh)
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(description="Run all cases.")
+
+    parser.add_argument(
+        '--nthreads', dest='nthreads', type=int, default=None,
+        help='total number of OpenMP threads shared by all running solvers')
+
+    parser.add_argument(
+        '--njobs', dest='njobs', type=int, default=1,
+        help='number of cases running at the same time')
+
+    parser.add_argument(
+        '--checkpt-interval', dest='checkpt_interval', type=int, default=500,
+        help='level-1 time steps between checkpoints; 0 disables checkpoints')
+
+    parser.add_argument(
+        '--dt-min', dest='dt_min', type=float, default=None,
+        help='kill a solver whose level-1 dt drops below this value')
+
+    parser.add_argument(
+        '--volume-tol', dest='volume_tol', type=float, default=None,
+        help='kill a solver whose relative level-1 volume drift exceeds this value')
+
+    parser.add_argument(
+        '--wall-budget', dest='wall_budget', type=float, default=None,
+        help='kill a solver running longer than this many seconds')
+
+    parser.add_argument(
+        '--scratch', dest='scratch', type=str, default=None,
+        help='run solvers in this local scratch folder and publish frames to _output')
+
+    parser.add_argument(
+        '--cachedir', dest='cachedir', type=str, default=None,
+        help='keep a copy of finished outputs in this folder (default: no cache)')
+
+    args = parser.parse_args()
+
+    run_all(
+        args.nthreads, args.njobs, args.checkpt_interval or None,
+        {"dt_min": args.dt_min, "volume_tol": args.volume_tol,
+         "wall_budget": args.wall_budget}, args.scratch, args.cachedir)
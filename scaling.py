@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+OpenMP strong-scaling study of the solvers.
+
+A case runs with OMP_NUM_THREADS = 1, 2, 4, ..., N, several times for each
+thread count. The median wall times give the speedup T(1)/T(n) and the
+parallel efficiency T(1)/(n T(n)), which are written to a CSV file and
+plotted for each (solver, case) pair. Wall times are taken when the solver
+exits (see `benchmark.benchmark_case`), so the short runs at high thread counts
+are not rounded up to a polling interval.
+"""
+import os
+import sys
+import logging
+import benchmark
+
+
+# logger
+logger = logging.getLogger("scaling.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_scaling.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+
+def get_thread_counts(nmax):
+    """1, 2, 4, ... up to nmax, plus nmax itself."""
+
+    counts = []
+    n = 1
+    while n < nmax:
+        counts.append(n)
+        n *= 2
+    counts.append(nmax)
+
+    return counts
+
+def run_scaling(solver, casepath, thread_counts, repeats=3, tfinal=None):
+    """Run a case with each thread count several times.
+
+    Returns a list of rows (nthreads, median, min, max wall time, speedup,
+    efficiency), and the raw wall times as a dict keyed by thread count.
+    """
+    import numpy
+
+    walltimes = {}
+    for nthreads in thread_counts:
+        walltimes[nthreads] = []
+        for i in range(repeats):
+            records = benchmark.benchmark_case(solver, casepath, tfinal, nthreads)
+            walltimes[nthreads].append(records[0]["walltime"])
+            logger.info("%s, %s, %d threads, repeat %d: %.3f s", os.path.basename(solver),
+                        casepath, nthreads, i, walltimes[nthreads][-1])
+
+    # the speedup is relative to the smallest thread count
+    base = numpy.median(walltimes[thread_counts[0]]) * thread_counts[0]
+
+    rows = []
+    for nthreads in thread_counts:
+        median = numpy.median(walltimes[nthreads])
+        rows.append([nthreads, median, min(walltimes[nthreads]), max(walltimes[nthreads]),
+                     base/median, base/median/nthreads])
+
+    return rows, walltimes
+
+def write_scaling(rows, csvfile):
+    """Write the speedup and efficiency table to a CSV file."""
+    import numpy
+
+    numpy.savetxt(
+        csvfile, numpy.array(rows, dtype=numpy.float64), delimiter=",",
+        header="nthreads,median walltime,min walltime,max walltime,speedup,efficiency")
+
+    logger.info("Done writing %s", csvfile)
+
+def plot_scaling(rows, title, savepath):
+    """Plot the speedup and efficiency curves."""
+    import numpy
+    from matplotlib import pyplot
+
+    rows = numpy.array(rows, dtype=numpy.float64)
+
+    fig, (ax1, ax2) = pyplot.subplots(1, 2, figsize=(10, 4), dpi=100)
+
+    ax1.plot(rows[:, 0], rows[:, 4], "o-", label="measured")
+    ax1.plot(rows[:, 0], rows[:, 0], "k--", label="ideal")
+    ax1.set_xscale("log")
+    ax1.set_yscale("log")
+    ax1.set_xticks(rows[:, 0])
+    ax1.set_xticklabels(["{:d}".format(int(n)) for n in rows[:, 0]])
+    ax1.set_xlabel("OpenMP threads")
+    ax1.set_ylabel("Speedup")
+    ax1.legend(loc=0)
+    ax1.grid()
+
+    ax2.plot(rows[:, 0], rows[:, 5], "o-")
+    ax2.set_xscale("log")
+    ax2.set_xticks(rows[:, 0])
+    ax2.set_xticklabels(["{:d}".format(int(n)) for n in rows[:, 0]])
+    ax2.set_ylim(0, 1.1)
+    ax2.set_xlabel("OpenMP threads")
+    ax2.set_ylabel("Parallel efficiency")
+    ax2.grid()
+
+    fig.suptitle(title)
+    fig.savefig(savepath, dpi=100, bbox_inches="tight")
+    pyplot.close(fig)
+
+    logger.info("Done creating figure %s", savepath)
+
+if __name__ == "__main__":
+    import argparse
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(description="OpenMP strong-scaling study.")
+
+    parser.add_argument(
+        '--cases', dest='cases', type=str, nargs="+", default=["single-mesh-tests/dx=1"],
+        help='case folders to run')
+
+    parser.add_argument(
+        '--solvers', dest='solvers', type=str, nargs="+", default=["xgeoclaw.original"],
+        help='executables in bin to run')
+
+    parser.add_argument(
+        '--max-threads', dest='max_threads', type=int, default=os.cpu_count(),
+        help='the largest OMP_NUM_THREADS tested')
+
+    parser.add_argument(
+        '--repeats', dest='repeats', type=int, default=3,
+        help='number of runs for each thread count')
+
+    parser.add_argument(
+        '--tfinal', dest='tfinal', type=float, default=None,
+        help='shortened final time of the runs (default: tfinal in setrun.py)')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+    scaling_path = os.path.join(repo_path, "scaling")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    if not os.path.isdir(scaling_path):
+        os.makedirs(scaling_path)
+
+    for case in args.cases:
+        for solver in args.solvers:
+            rows, _ = run_scaling(
+                os.path.join(repo_path, "bin", solver), os.path.join(repo_path, case),
+                get_thread_counts(args.max_threads), args.repeats, args.tfinal)
+
+            name = "{}_{}".format(solver, case.strip("/").replace("/", "_"))
+            write_scaling(rows, os.path.join(scaling_path, name+".csv"))
+            plot_scaling(rows, "{}, {}".format(solver, case),
+                         os.path.join(scaling_path, name+".png"))
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Publish solver outputs from a scratch folder to a case's _output folder.
+
+The solver runs in a fast local scratch folder, and a background thread
+copies finished frames and checkpoints to _output while the solver runs. Each
+file is copied to a temporary name in _output and then renamed, so readers
+never see a partially written file. The files of a frame are published in the
+order fort.b, fort.a, fort.q, and fort.t, and a checkpoint is published
+before its time stamp file, so a frame (checkpoint) is complete in _output
+once its fort.t (fort.tck) file is there.
+"""
+import os
+import re
+import shutil
+import logging
+
+
+# logger
+logger = logging.getLogger("staging.py")
+
+
+def publish_file(run_path, out_path, fname):
+    """Copy a file from run_path to out_path atomically."""
+
+    tmp = os.path.join(out_path, ".{}.publishing".format(fname))
+    shutil.copyfile(os.path.join(run_path, fname), tmp)
+    os.replace(tmp, os.path.join(out_path, fname))
+
+def publish_ready(run_path, out_path, published, finished=False):
+    """Publish frames and checkpoints that are completely written.
+
+    A frame is complete once the solver writes fort.t of the next frame, and a
+    checkpoint is complete once its fort.tck file exists. When `finished` is
+    True, all remaining files are published. `published` is the set of names
+    published so far, plus (name, mtime) of the published checkpoint time
+    stamp files, and is updated in place.
+    """
+
+    present = set(os.listdir(run_path))
+    fnames = present - published
+
+    # frames
+    frames = sorted([int(f[6:]) for f in fnames if re.match(r"^fort\.t[0-9]{4}$", f)])
+    for fno in frames:
+        if not finished and "fort.t{:04}".format(fno+1) not in present:
+            continue
+        for prefix in ["fort.b", "fort.a", "fort.q", "fort.t"]:
+            fname = "{}{:04}".format(prefix, fno)
+            if fname in fnames:
+                publish_file(run_path, out_path, fname)
+                published.add(fname)
+
+    # checkpoints; the solver rewrites fort.chkaaaaa and fort.chkbbbbb in turn,
+    # so they are published again whenever their time stamp files change
+    for fname in sorted(present):
+        if not re.match(r"^fort\.tck([0-9]{5}|aaaaa|bbbbb)$", fname):
+            continue
+        stamp = (fname, os.stat(os.path.join(run_path, fname)).st_mtime_ns)
+        if stamp in published:
+            continue
+        publish_file(run_path, out_path, fname.replace("tck", "chk"))
+        publish_file(run_path, out_path, fname)
+        published.update([fname, fname.replace("tck", "chk"), stamp])
+
+    # everything else, e.g., fort.amr, once the solver is done
+    if finished:
+        for fname in sorted(set(os.listdir(run_path)) - published):
+            if os.path.isfile(os.path.join(run_path, fname)):
+                publish_file(run_path, out_path, fname)
+                published.add(fname)
+
+def publish_loop(run_path, out_path, published, stop, interval=10):
+    """Publish complete files every `interval` seconds until `stop` is set."""
+
+    while not stop.wait(interval):
+        try:
+            publish_ready(run_path, out_path, published)
+        except OSError as err:
+            logger.warning("Publishing from %s failed; will retry: %s", run_path, err)
+
+def stage_inputs(out_path, run_path, restart_file=None):
+    """Copy *.data files (and the restart checkpoint) from out_path to run_path."""
+    import glob
+
+    for datafile in glob.glob(os.path.join(out_path, "*.data")):
+        shutil.copyfile(datafile, os.path.join(run_path, os.path.basename(datafile)))
+
+    if restart_file is not None:
+        for fname in [restart_file, restart_file.replace("chk", "tck")]:
+            shutil.copyfile(os.path.join(out_path, fname), os.path.join(run_path, fname))
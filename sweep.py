@@ -0,0 +1,235 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Generate and run a parameter sweep from a base setrun.py.
+
+Each combination of the parameters becomes a case folder under sweep-tests.
+The folder holds a small generated setrun.py, which calls the setrun() of the
+base case and then overrides the swept parameters. The cases are handed to
+run.py's scheduler, so a sweep runs concurrently, with checkpoints, the run
+cache, and the watchdog.
+
+Swept parameters:
+
+    dx: cell size of level 1 (the same in x and y)
+    levels: amrdata.amr_levels_max
+    ratio: refinement ratio in x, y, and t between all consecutive levels
+    regrid_interval: amrdata.regrid_interval
+    dry_tolerance: geo_data.dry_tolerance
+    solver: name of the executable in bin
+"""
+import os
+import sys
+import itertools
+import logging
+import run
+
+
+# logger
+logger = logging.getLogger("sweep.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_sweep.log", "w", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+# the content of a generated setrun.py
+setrun_template = '''"""
+Generated by sweep.py. Do not edit; edit the base case and re-run sweep.py.
+"""
+import os
+import importlib.util
+
+base = {base!r}
+params = {params!r}
+
+
+def setrun(claw_pkg='geoclaw'):
+    """Call setrun() of the base case and override the swept parameters."""
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(
+        "base_setrun", os.path.join(here, base))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    rundata = module.setrun(claw_pkg)
+    clawdata = rundata.clawdata
+    amrdata = rundata.amrdata
+
+    for i in range(2):
+        clawdata.num_cells[i] = int(round(
+            (clawdata.upper[i]-clawdata.lower[i])/params["dx"]))
+
+    amrdata.amr_levels_max = params["levels"]
+    amrdata.refinement_ratios_x = [params["ratio"]] * max(1, params["levels"]-1)
+    amrdata.refinement_ratios_y = [params["ratio"]] * max(1, params["levels"]-1)
+    amrdata.refinement_ratios_t = [params["ratio"]] * max(1, params["levels"]-1)
+    amrdata.regrid_interval = params["regrid_interval"]
+    rundata.geo_data.dry_tolerance = params["dry_tolerance"]
+
+    return rundata
+
+
+if __name__ == '__main__':
+    # Set up run-time parameters and write all data files.
+    import sys
+    rundata = setrun(*sys.argv[1:])
+    rundata.write()
+'''
+
+default_grid = {
+    "dx": [4.0],
+    "levels": [2],
+    "ratio": [4],
+    "regrid_interval": [1],
+    "dry_tolerance": [1e-4],
+    "solver": ["xgeoclaw.original"]}
+
+
+def get_case_name(params):
+    """Folder name of a case in a sweep."""
+    return "{}_dx={:g}_levels={}_ratio={}_regrid={}_drytol={:g}".format(
+        params["solver"].replace("xgeoclaw.", ""), params["dx"], params["levels"],
+        params["ratio"], params["regrid_interval"], params["dry_tolerance"])
+
+def expand_grid(grid):
+    """Expand a dict of parameter lists into a list of parameter dicts."""
+
+    params = dict(default_grid)
+    params.update(grid)
+    keys = list(default_grid.keys())
+
+    return [dict(zip(keys, values)) for values in itertools.product(*[params[k] for k in keys])]
+
+def create_case(basecase, params, sweep_path):
+    """Create the folder and setrun.py of a case; return the case path.
+
+    The setrun.py is only rewritten when its content changes, so the cached
+    metadata and the run cache of an unchanged case stay valid.
+    """
+
+    casepath = os.path.join(sweep_path, get_case_name(params))
+    if not os.path.isdir(casepath):
+        os.makedirs(casepath)
+
+    setrunpath = os.path.join(casepath, "setrun.py")
+    content = setrun_template.format(
+        base=os.path.relpath(os.path.join(basecase, "setrun.py"), casepath),
+        params={k: v for k, v in params.items() if k != "solver"})
+
+    if os.path.isfile(setrunpath):
+        with open(setrunpath, "r") as f:
+            if f.read() == content:
+                return casepath
+
+    with open(setrunpath, "w") as f:
+        f.write(content)
+
+    logger.debug("Created %s", setrunpath)
+    return casepath
+
+def create_sweep(basecase, grid, sweep_path):
+    """Create all cases of a sweep and return the (solver, casepath) jobs."""
+
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    basecase = os.path.abspath(basecase)
+
+    jobs = []
+    for params in expand_grid(grid):
+        if params["levels"] < 1 or params["dx"] <= 0:
+            logger.warning("Skip invalid parameters: %s", params)
+            continue
+        casepath = create_case(basecase, params, sweep_path)
+        jobs.append((os.path.join(repo_path, "bin", params["solver"]), casepath))
+
+    logger.info("Sweep of %d cases from %s in %s", len(jobs), basecase, sweep_path)
+    return jobs
+
+if __name__ == "__main__":
+    import argparse
+
+    # messages of run.py go to the file log of this script, too
+    run.logger.addHandler(fh)
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(
+        description="Generate and run a parameter sweep from a base case.")
+
+    parser.add_argument(
+        '--base', dest='base', type=str, default="amr-tests/original",
+        help='the case folder whose setrun.py is the base of the sweep')
+
+    parser.add_argument(
+        '--dx', dest='dx', type=float, nargs="+", default=default_grid["dx"],
+        help='cell sizes of level 1')
+
+    parser.add_argument(
+        '--levels', dest='levels', type=int, nargs="+", default=default_grid["levels"],
+        help='maximum AMR levels')
+
+    parser.add_argument(
+        '--ratio', dest='ratio', type=int, nargs="+", default=default_grid["ratio"],
+        help='refinement ratios between consecutive levels')
+
+    parser.add_argument(
+        '--regrid-interval', dest='regrid_interval', type=int, nargs="+",
+        default=default_grid["regrid_interval"], help='regrid intervals')
+
+    parser.add_argument(
+        '--dry-tolerance', dest='dry_tolerance', type=float, nargs="+",
+        default=default_grid["dry_tolerance"], help='dry tolerances')
+
+    parser.add_argument(
+        '--solver', dest='solver', type=str, nargs="+", default=default_grid["solver"],
+        help='executables in bin')
+
+    parser.add_argument(
+        '--nthreads', dest='nthreads', type=int, default=None,
+        help='total number of OpenMP threads shared by all running solvers')
+
+    parser.add_argument(
+        '--njobs', dest='njobs', type=int, default=1,
+        help='number of cases running at the same time')
+
+    parser.add_argument(
+        '--create-only', dest='create_only', action="store_true",
+        help='only create case folders and *.data files; do not run them')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    grid = {k: getattr(args, k) for k in default_grid.keys()}
+    jobs = create_sweep(args.base, grid, os.path.join(repo_path, "sweep-tests"))
+
+    if args.create_only:
+        for _, case in jobs:
+            run.create_data(case)
+    else:
+        run.run_jobs(jobs, args.nthreads, args.njobs)
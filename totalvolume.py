@@ -12,6 +12,10 @@ Calculate total volume and plot them.
 import os
 import sys
 import logging
+import caseinfo
+import framereader
+import frameindex
+import diagstore
 
 
 # logger
@@ -46,62 +50,256 @@ def get_volumes_single_frame(maxlvl, solution):
 
     return volumes
 
-def create_volume_datafile(casepath):
-    """Create a volume.csv for a case."""
+def get_coverage_masks(solution):
+    """Get a mask of each patch marking the cells covered by finer patches.
+
+    For each level except the finest, a bitmap over the whole domain at the
+    resolution of that level is marked with the extents of the patches one
+    level finer, in integer cell indices; each patch then takes its mask as a
+    slice of the bitmap. Returns a list of boolean (mx, my) arrays in the order
+    of `solution.states`.
+    """
+    import numpy
+
+    states = solution.states
+    levels = [state.patch.level for state in states]
+
+    # domain and cell sizes of each level from the patches
+    coarse = [state.patch for state in states if state.patch.level == min(levels)]
+    x0 = min([p.lower_global[0] for p in coarse])
+    y0 = min([p.lower_global[1] for p in coarse])
+    x1 = max([p.upper_global[0] for p in coarse])
+    y1 = max([p.upper_global[1] for p in coarse])
+    delta = {state.patch.level: state.patch.delta for state in states}
+
+    def get_extent(patch, dx, dy):
+        """Cell indices of a patch's lower and upper corners on a level."""
+        i0 = int(round((patch.lower_global[0]-x0)/dx))
+        j0 = int(round((patch.lower_global[1]-y0)/dy))
+        i1 = int(round((patch.upper_global[0]-x0)/dx))
+        j1 = int(round((patch.upper_global[1]-y0)/dy))
+        return i0, j0, i1, j1
+
+    bitmaps = {}
+    for lvl in sorted(delta):
+        if lvl+1 not in delta:
+            continue
+        dx, dy = delta[lvl]
+        bitmap = numpy.zeros(
+            (int(round((x1-x0)/dx)), int(round((y1-y0)/dy))), dtype=bool)
+        for state in states:
+            if state.patch.level == lvl+1:
+                i0, j0, i1, j1 = get_extent(state.patch, dx, dy)
+                bitmap[i0:i1, j0:j1] = True
+        bitmaps[lvl] = bitmap
+
+    masks = []
+    for state in states:
+        p = state.patch
+        if p.level not in bitmaps:
+            masks.append(numpy.zeros(p.num_cells_global, dtype=bool))
+            continue
+        i0, j0, i1, j1 = get_extent(p, p.delta[0], p.delta[1])
+        masks.append(bitmaps[p.level][i0:i1, j0:j1])
+
+    return masks
+
+def get_composite_volume(solution, masks=None):
+    """Get the volume of the composite grid, i.e., the finest patches available
+    at each point, from the solution of a single time frame."""
+    import numpy
+
+    if masks is None:
+        masks = get_coverage_masks(solution)
+
+    volume = 0.
+    for state, mask in zip(solution.states, masks):
+        p = state.patch
+        volume += numpy.sum(state.q[0, :, :][~mask]) * p.delta[0] * p.delta[1]
+
+    return volume
+
+def get_frame_volumes(out_path, frameno, nlevels, index=None):
+    """Read a frame and return its time and volumes.
+
+    The volumes are those of levels 1 to nlevels, followed by the composite
+    volume.
+    """
+    import numpy
+
+    soln = framereader.read_frame(
+        out_path, frameno, read_aux=False, index=index, components=slice(0, 1))
+
+    return soln.state.t, numpy.append(
+        get_volumes_single_frame(nlevels, soln), get_composite_volume(soln))
+
+def get_chunk_volumes(out_path, framenos, nlevels, index=None):
+    """Return a list of (time, volumes) of several frames."""
+    return [get_frame_volumes(out_path, fno, nlevels, index) for fno in framenos]
+
+def get_volume_columns(nlevels):
+    """Columns of the volume store of a case with nlevels AMR levels."""
+
+    return [("frame", "i4"), ("mtime_t", "i8"), ("mtime_q", "i8"), ("mtime_b", "i8"),
+            ("t", "f8")] + [("level{}".format(lvl), "f8") for lvl in range(1, nlevels+1)] + \
+           [("composite", "f8")]
+
+def load_volume_record(casepath, nlevels):
+    """Load the rows of the volume store of a case.
+
+    Each row has the frame number, the modification times of fort.t, fort.q,
+    and fort.b when it was reduced, time, the volume on each level, and the
+    composite volume. Returns a dict of frame number -> (mtimes, [t, volumes]);
+    it is empty if there is no store or its columns do not match.
+    """
+    import numpy
+
+    path = os.path.join(casepath, "volume.store")
+    if not os.path.isfile(os.path.join(path, "schema.json")):
+        return {}
+
+    columns = get_volume_columns(nlevels)
+    if diagstore.read_schema(path)[0] != diagstore.normalize_columns(columns):
+        logger.warning("Columns of %s changed; recompute all frames", path)
+        return {}
+
+    data = diagstore.read_columns(path)
+    mtimes = numpy.column_stack([data["mtime_t"], data["mtime_q"], data["mtime_b"]])
+    values = numpy.column_stack([data[name] for name, _ in columns[4:]])
+
+    return {int(fno): (m.tolist(), row) for fno, m, row in zip(data["frame"], mtimes, values)}
+
+def save_volume_datafile(casepath, rows, append=0):
+    """Write rows to the volume store of a case.
+
+    Arguments:
+        casepath: the case folder.
+        rows: a dict of frame number -> (mtimes, [t, volumes]).
+        append: number of leading rows (in frame order) already in the store;
+            only the rows after them are appended. 0 to rewrite the store.
+    """
     import numpy
 
-    casepath = os.path.abspath(casepath)
-    out_path = os.path.join(casepath, "_output")
+    framenos = sorted(rows)[append:]
+    mtimes = numpy.array([rows[fno][0] for fno in framenos], dtype=numpy.int64).reshape(-1, 3)
+    values = numpy.array([rows[fno][1] for fno in framenos], dtype=numpy.float64)
+    columns = get_volume_columns(values.shape[1]-2)
+
+    data = {"frame": framenos, "mtime_t": mtimes[:, 0], "mtime_q": mtimes[:, 1],
+            "mtime_b": mtimes[:, 2]}
+    for i, (name, _) in enumerate(columns[4:]):
+        data[name] = values[:, i]
+
+    path = os.path.join(casepath, "volume.store")
+    if append:
+        diagstore.append_rows(path, data)
+    else:
+        diagstore.write_store(path, columns, data)
+
+def get_volume_mtimes(index, frameno):
+    """The modification times of the files of a frame that volumes depend on."""
+
+    frame = frameindex.get_frame(index, frameno)[0]
+    return [int(frame[key]) for key in ["mtime_t", "mtime_q", "mtime_b"]]
+
+def create_volume_datafiles(cases, nprocs=None):
+    """Create or update the volume stores of cases with a pool of processes.
+
+    Only frames that are not in the store yet, or whose files changed since
+    they were reduced, are read, in chunks distributed to the processes by
+    `framereader.map_frames`. New frames after the existing rows are appended
+    to the store; otherwise, e.g., after a restart rewrote some frames or some
+    frames were deleted, the store is rewritten in frame order.
+
+    The store is volume.store in the case folder (see diagstore.py); its
+    columns are frame, mtime_t, mtime_q, mtime_b, t, level1, ..., and
+    composite.
+
+    Arguments:
+        cases: a list of case folders.
+        nprocs: number of processes; default to the number of CPUs.
+    """
     repo_path = os.path.dirname(os.path.abspath(__file__))
     claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
 
-    logger.info("Creating total volume datafile for case %s", casepath)
-    if os.path.isfile(os.path.join(casepath, "volume.csv")):
-        logger.warning("%s exists. Skip.", os.path.join(casepath, "volume.csv"))
-        logger.handlers[0].flush()
-        logger.handlers[1].flush()
-        return
-
-    # add environment variables
+    # add environment variables (inherited by the worker processes)
     os.environ["CLAW"] = claw_path
 
     # add clawpack python package search path
     if claw_path != sys.path[0]:
         sys.path.insert(0, claw_path)
 
-    # import utilities
-    from clawpack import pyclaw
-
-    # get # of frames from setrun.py
-    if casepath != sys.path[0]:
-        sys.path.insert(0, casepath)
-    import setrun # import the setrun.py
-    rundata = setrun.setrun() # get ClawRunData object
-    nframes = rundata.clawdata.num_output_times + 1
-    nlevels = rundata.amrdata.amr_levels_max
-    del rundata
-    del sys.modules["setrun"]
-    del sys.path[0]
-
-    data = numpy.zeros((nframes, 1+nlevels), dtype=numpy.float64)
-    for fno in range(0, nframes):
-        # empty solution object
-        soln = pyclaw.Solution()
-
-        # read
-        soln.read(fno, out_path, file_format="binary", read_aux=False)
-
-        # calculate total volume at each grid level
-        data[fno, 0] = soln.state.t
-        data[fno, 1:] = get_volumes_single_frame(nlevels, soln)
-
-    numpy.savetxt(os.path.join(casepath, "volume.csv"), data, delimiter=",")
-    logger.info("Done creating total volume datafile.")
+    # frames of each case that are new or changed
+    todo = {}
+    for casepath in cases:
+        casepath = os.path.abspath(casepath)
+        info = caseinfo.get_case_info(casepath)
+        index = frameindex.load_index(os.path.join(casepath, "_output"))
+        if len(index.frames) == 0:
+            logger.warning("No frames in %s. Skip.", os.path.join(casepath, "_output"))
+            continue
+
+        done = load_volume_record(casepath, info["nlevels"])
+
+        rows = {}
+        framenos = []
+        for fno in index.frames["frame"].tolist():
+            if fno in done and done[fno][0] == get_volume_mtimes(index, fno):
+                rows[fno] = done[fno]
+            else:
+                framenos.append(fno)
+
+        if not framenos and len(rows) == len(done):
+            logger.info("%s is up to date. Skip.", os.path.join(casepath, "volume.store"))
+            continue
+
+        # frames were only deleted; drop their rows without reading anything
+        if not framenos:
+            logger.info("Removing %d deleted frames from %s", len(done)-len(rows),
+                        os.path.join(casepath, "volume.store"))
+            save_volume_datafile(casepath, rows)
+            continue
+
+        # new frames can be appended if all old rows are still valid
+        append = len(rows) if len(rows) == len(done) and (
+            not rows or min(framenos) > max(rows)) else 0
+
+        todo[casepath] = {
+            "nlevels": info["nlevels"], "cells": sum(info["cells"]), "index": index,
+            "rows": rows, "framenos": framenos, "append": append}
+
+    if not todo:
+        return
+
+    # the largest cases first
+    todo = dict(sorted(todo.items(), key=lambda item: -item[1]["cells"]*len(item[1]["framenos"])))
+    for casepath, case in todo.items():
+        logger.info("Reducing %d frames of case %s", len(case["framenos"]), casepath)
+
+    def get_args(casepath, framenos):
+        case = todo[casepath]
+        return (os.path.join(casepath, "_output"), framenos, case["nlevels"],
+                frameindex.select_frames(case["index"], framenos))
+
+    for casepath, results in framereader.map_frames(
+            get_chunk_volumes, {casepath: case["framenos"] for casepath, case in todo.items()},
+            get_args, nprocs):
+        case = todo[casepath]
+        for fno, (t, vols) in results.items():
+            case["rows"][fno] = (get_volume_mtimes(case["index"], fno), [t] + list(vols))
+
+        save_volume_datafile(casepath, case["rows"], case["append"])
+        logger.info("Done creating total volume store for case %s", casepath)
+
     logger.handlers[0].flush()
     logger.handlers[1].flush()
 
-def create_all_volume_datafiles():
-    """Create volume.csv in all cases."""
+def create_volume_datafile(casepath, nprocs=1):
+    """Create or update the volume store of a case."""
+    create_volume_datafiles([casepath], nprocs)
+
+def create_all_volume_datafiles(nprocs=None):
+    """Create or update the volume stores of all cases."""
 
     repo_path = os.path.dirname(os.path.abspath(__file__))
 
@@ -112,9 +310,25 @@ def create_all_volume_datafiles():
         "single-mesh-tests/dx=1", "single-mesh-tests/dx=0.5",
         "single-mesh-tests/dx=0.25", "single-mesh-tests/dx=0.125"]
 
-    for case in cases:
-        case = os.path.join(repo_path, case)
-        create_volume_datafile(case)
+    create_volume_datafiles([os.path.join(repo_path, case) for case in cases], nprocs)
 
 if __name__ == "__main__":
-    create_all_volume_datafiles()
+    import argparse
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(description="Create volume stores of cases.")
+
+    parser.add_argument(
+        '--cases', dest='cases', type=str, nargs="+", default=None,
+        help='case folders (default: all cases)')
+
+    parser.add_argument(
+        '--nprocs', dest='nprocs', type=int, default=None,
+        help='number of processes reading frames (default: number of CPUs)')
+
+    args = parser.parse_args()
+
+    if args.cases is None:
+        create_all_volume_datafiles(args.nprocs)
+    else:
+        create_volume_datafiles(args.cases, args.nprocs)
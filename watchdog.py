@@ -0,0 +1,265 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Watch a running solver and kill it early when it goes wrong.
+
+The watchdog follows the solver's STDOUT (with verbosity > 0, GeoClaw prints
+the CFL number and dt of every time step) and the frames written to _output.
+The solver is killed when any of the following criteria trips:
+
+    dt_min: the level-1 time step drops below this floor.
+    volume_tol: the relative change of the total volume on `volume_level`
+        from that of the first frame in _output exceeds this tolerance.
+    wall_budget: the wall time in seconds exceeds this budget.
+
+A criterion set to None is not checked.
+"""
+import os
+import re
+import json
+import time
+import types
+import signal
+import logging
+
+
+# logger
+logger = logging.getLogger("watchdog.py")
+
+# matches lines like "AMRCLAW: level  1  CFL = .8917  dt = 0.1234E+00  final t = 0.1234E+02"
+step_pattern = re.compile(
+    r"level\s+(\d+)\s+CFL\s*=\s*(\S+)\s+dt\s*=\s*(\S+)\s+final\s+t\s*=\s*(\S+)")
+
+default_criteria = {
+    "dt_min": None,
+    "volume_tol": None,
+    "volume_level": 1,
+    "wall_budget": None}
+
+
+class WatchdogAbort(RuntimeError):
+    """A solver killed by the watchdog."""
+    pass
+
+
+def _to_float(string):
+    """Convert Fortran-style floats, e.g., 0.1D+01, to Python floats."""
+    return float(string.upper().replace("D", "E"))
+
+def read_steps(stdout_file, offset=0):
+    """Parse time-step lines in a solver STDOUT file starting from offset.
+
+    Returns a list of (level, cfl, dt, t) and the offset of the first
+    unparsed byte, so the file can be followed incrementally.
+    """
+
+    if not os.path.isfile(stdout_file):
+        return [], offset
+
+    with open(stdout_file, "rb") as f:
+        f.seek(offset)
+        chunk = f.read()
+
+    # only parse complete lines
+    end = chunk.rfind(b"\n") + 1
+    steps = []
+    for line in chunk[:end].decode("utf-8", "replace").splitlines():
+        match = step_pattern.search(line)
+        if match is None:
+            continue
+        try:
+            steps.append((int(match.group(1)), _to_float(match.group(2)),
+                          _to_float(match.group(3)), _to_float(match.group(4))))
+        except ValueError:
+            continue
+
+    return steps, offset + end
+
+def get_frame_volume(out_path, frameno, level):
+    """Get the total volume on a level of a frame.
+
+    Only the depth of the patches on this level is mapped, so frames with
+    patches on finer levels are fine and the other levels are not read.
+    """
+    import framereader
+    from totalvolume import get_volumes_single_frame
+
+    soln = framereader.read_frame(
+        out_path, frameno, read_aux=False, levels=[level], components=slice(0, 1))
+
+    return get_volumes_single_frame(level, soln)[level-1]
+
+def _first_frame(out_path):
+    """The smallest frame number in an output folder (None if there is none)."""
+
+    fnos = [int(f[6:]) for f in os.listdir(out_path) if re.match(r"^fort\.t[0-9]{4}$", f)]
+    return min(fnos) if fnos else None
+
+def _wait4(job, block):
+    """Reap a Popen job with os.wait4; return its rusage or None if still running.
+
+    If the job was already reaped elsewhere (e.g., by Popen.poll), its return
+    code comes from the Popen object and the rusage is all zeros.
+    """
+
+    try:
+        pid, status, usage = os.wait4(job.pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        if job.returncode is None:
+            job.poll()
+        logger.warning("Solver %d was reaped elsewhere; its CPU times are unknown", job.pid)
+        return types.SimpleNamespace(ru_utime=0., ru_stime=0., ru_maxrss=0)
+
+    if pid == 0:
+        return None
+
+    if os.WIFEXITED(status):
+        job.returncode = os.WEXITSTATUS(status)
+    else:
+        job.returncode = -os.WTERMSIG(status)
+
+    return usage
+
+def _wait4_timeout(job, timeout, step=0.05):
+    """Wait up to `timeout` seconds for a Popen job to exit.
+
+    The job is checked every `step` seconds, so its exit is noticed within
+    `step` seconds. Returns its rusage, or None if it is still running.
+    """
+
+    deadline = time.perf_counter() + timeout
+    while True:
+        usage = _wait4(job, False)
+        remaining = deadline - time.perf_counter()
+        if usage is not None or remaining <= 0:
+            return usage
+        time.sleep(min(step, remaining))
+
+def _read_peak_rss(pid):
+    """Read the peak resident memory (bytes) of a process from /proc; 0 if unknown."""
+
+    try:
+        with open("/proc/{}/status".format(pid), "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return 0
+
+def write_status(statusfile, status):
+    """Write a status dict to a JSON file atomically."""
+
+    with open(statusfile+".tmp", "w") as f:
+        json.dump(status, f, indent=1)
+    os.replace(statusfile+".tmp", statusfile)
+
+def watch(job, stdout_file, out_path, criteria=None, poll=5):
+    """Watch a solver process until it exits or the watchdog kills it.
+
+    Arguments:
+        job: the subprocess.Popen object of the solver.
+        stdout_file: the file the solver's STDOUT is redirected to.
+        out_path: the folder frames show up in, i.e., _output also when the
+            solver runs in a scratch folder and its frames are published.
+        criteria: a dict overriding `default_criteria`.
+        poll: seconds between two checks of the criteria.
+
+    Without any criteria, the solver is waited for with a blocking os.wait4;
+    otherwise its exit is checked much more often than the criteria. Either
+    way, the wall time is that of the solver's exit, not of the next check.
+
+    Returns a dict with the last seen level-1 dt and time, the volume drift,
+    the reason the solver was killed (None if it was not), and the resource
+    usage of the solver: wall time, user and system CPU time (seconds), and
+    peak resident memory (bytes). The solver is reaped with os.wait4 to get
+    its own rusage; job.returncode is set accordingly.
+    """
+
+    crit = dict(default_criteria)
+    if criteria is not None:
+        crit.update(criteria)
+
+    state = {"reason": None, "t": None, "dt": None, "volume_drift": None, "peak_rss": 0}
+    offset = os.path.getsize(stdout_file) if os.path.isfile(stdout_file) else 0
+    vol0 = None
+    first = None
+    checked = -1
+    active = any([crit[key] is not None for key in ["dt_min", "volume_tol", "wall_budget"]])
+    start = time.perf_counter()
+
+    while True:
+        if not active:
+            usage = _wait4(job, True)
+            break
+
+        usage = _wait4_timeout(job, poll)
+        if usage is not None:
+            break
+
+        state["peak_rss"] = max(state["peak_rss"], _read_peak_rss(job.pid))
+
+        # time steps printed since last check
+        steps, offset = read_steps(stdout_file, offset)
+        for level, cfl, dt, t in steps:
+            if level != 1:
+                continue
+            state["t"], state["dt"] = t, dt
+            if crit["dt_min"] is not None and dt < crit["dt_min"]:
+                state["reason"] = "level-1 dt {} at t={} below the floor {}".format(
+                    dt, t, crit["dt_min"])
+
+        # the newest complete frame, i.e., the one before the newest fort.t
+        if crit["volume_tol"] is not None and state["reason"] is None:
+            if first is None:
+                first = _first_frame(out_path)
+                checked = -1 if first is None else first-1
+            fno = checked
+            while os.path.isfile(os.path.join(out_path, "fort.t{:04}".format(fno+2))):
+                fno += 1
+            if fno > checked:
+                vol = get_frame_volume(out_path, fno, crit["volume_level"])
+                if vol0 is None:
+                    vol0 = get_frame_volume(out_path, first, crit["volume_level"])
+                checked = fno
+                state["volume_drift"] = abs(vol-vol0) / vol0 if vol0 != 0 else 0.0
+                if state["volume_drift"] > crit["volume_tol"]:
+                    state["reason"] = "volume drift {:.3e} at frame {} beyond {}".format(
+                        state["volume_drift"], fno, crit["volume_tol"])
+
+        if crit["wall_budget"] is not None and state["reason"] is None:
+            if time.perf_counter() - start > crit["wall_budget"]:
+                state["reason"] = "wall time beyond the budget of {} s".format(
+                    crit["wall_budget"])
+
+        if state["reason"] is not None:
+            logger.warning("Killing solver %d: %s", job.pid, state["reason"])
+
+            # signal the pid directly; Popen.terminate/kill would poll and may
+            # reap the solver before os.wait4 gets its rusage
+            os.kill(job.pid, signal.SIGTERM)
+            usage = _wait4_timeout(job, 30)
+            if usage is None:
+                os.kill(job.pid, signal.SIGKILL)
+                usage = _wait4(job, True)
+            break
+
+    state["walltime"] = time.perf_counter() - start
+
+    # the last time step, e.g., when nothing was checked while running
+    steps, offset = read_steps(stdout_file, offset)
+    for level, _, dt, t in steps:
+        if level == 1:
+            state["t"], state["dt"] = t, dt
+
+    state["user_time"] = usage.ru_utime
+    state["sys_time"] = usage.ru_stime
+    state["peak_rss"] = max(state["peak_rss"], usage.ru_maxrss*1024) # KiB on Linux
+    return state
@@ -0,0 +1,268 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Pi-Yueh Chuang <pychuang@gwu.edu>
+#
+# Distributed under terms of the MIT license.
+
+"""
+A work queue on a shared filesystem for running cases on several machines.
+
+The queue is a folder with four subfolders:
+
+    pending: jobs waiting to run, one JSON file per job
+    running: jobs claimed by workers
+    done: results of finished jobs
+    failed: errors of failed jobs
+
+A worker claims a job by renaming its file from pending to running; the rename
+is atomic, so only one worker wins a job. While running a job, the worker
+touches the job file regularly as a heartbeat, and `requeue` moves jobs whose
+heartbeat stopped back to pending. Job files are prefixed with their rank in
+longest-processing-time-first order, so workers take the longest jobs first.
+Case paths are stored relative to the repository, and a worker creates the
+*.data files of a case (which hold absolute paths of topography files) after it
+claims the job, so hosts may mount the repository at different paths.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import run
+import costmodel
+
+
+# logger
+logger = logging.getLogger("workqueue.py")
+logger.setLevel(logging.DEBUG)
+
+# log message to std io
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# file log
+fh = logging.FileHandler("neck_test_workqueue.log", "a", "utf-8")
+fh.setLevel(logging.DEBUG)
+fh.setFormatter(logging.Formatter(
+    '[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+
+# add handlers to the logger
+logger.addHandler(ch)
+logger.addHandler(fh)
+
+subfolders = ["pending", "running", "done", "failed"]
+
+
+def _write_json(fpath, data):
+    """Write a JSON file atomically."""
+
+    tmp = "{}.{}.{}.tmp".format(fpath, socket.gethostname(), os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, fpath)
+
+def _job_name(fname):
+    """The job name of a file name like 0003_amr-tests__original@host@pid.json."""
+    return fname.split("@")[0].replace(".json", "")
+
+def enqueue(queue_path, jobs, checkpt_interval=500):
+    """Put (solver, casepath) jobs into the pending folder of a queue.
+
+    Workers create the *.data files of a job, with `checkpt_interval`, after
+    they claim it.
+    """
+
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+
+    for sub in subfolders:
+        os.makedirs(os.path.join(queue_path, sub), exist_ok=True)
+
+    costs, _ = costmodel.estimate_costs(
+        [case for _, case in jobs], os.path.join(repo_path, "neck_test_timings.json"))
+
+    for rank, i in enumerate(costmodel.lpt_order(costs)):
+        solver, case = jobs[i]
+        case = os.path.relpath(case, repo_path)
+        name = "{:04}_{}".format(rank, case.replace("/", "__"))
+        _write_json(os.path.join(queue_path, "pending", name+".json"), {
+            "name": name, "case": case, "solver": os.path.basename(solver),
+            "cost": costs[i], "checkpt_interval": checkpt_interval})
+        logger.info("Enqueued %s", name)
+
+def claim(queue_path):
+    """Claim the first pending job; return (job dict, running file) or None."""
+
+    owner = "{}@{}".format(socket.gethostname(), os.getpid())
+
+    for fname in sorted(os.listdir(os.path.join(queue_path, "pending"))):
+        if not fname.endswith(".json"):
+            continue
+
+        src = os.path.join(queue_path, "pending", fname)
+        dst = os.path.join(queue_path, "running", "{}@{}.json".format(fname[:-5], owner))
+        try:
+            os.rename(src, dst)
+        except FileNotFoundError:
+            continue # another worker was faster
+
+        with open(dst, "r") as f:
+            return json.load(f), dst
+
+    return None
+
+def _heartbeat(fpath, stop, interval):
+    """Touch a file every `interval` seconds until `stop` is set."""
+
+    while not stop.wait(interval):
+        try:
+            os.utime(fpath)
+        except FileNotFoundError:
+            return
+
+def work(queue_path, nthreads=None, wait=False, poll=30, heartbeat=60, **kwargs):
+    """Claim and run jobs until the queue is empty.
+
+    If `wait` is True, keep polling for new jobs every `poll` seconds instead
+    of exiting. Extra keyword arguments are passed to `run.run_case`.
+    """
+    import threading
+    import traceback
+
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    host = socket.gethostname()
+
+    while True:
+        claimed = claim(queue_path)
+        if claimed is None:
+            if not wait:
+                break
+            time.sleep(poll)
+            continue
+
+        job, running_file = claimed
+        logger.info("Worker %s@%d runs %s", host, os.getpid(), job["name"])
+
+        stop = threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(running_file, stop, heartbeat))
+        beat.start()
+
+        result = dict(job)
+        result.update({"host": host, "pid": os.getpid(), "nthreads": nthreads})
+        try:
+            # *.data files with absolute paths under this host's mount point
+            casepath = os.path.join(repo_path, job["case"])
+            run.create_data(casepath, checkpt_interval=job["checkpt_interval"])
+
+            result["walltime"] = run.run_case_timed(
+                os.path.join(repo_path, "bin", job["solver"]), casepath, nthreads,
+                checkpt_interval=job["checkpt_interval"], **kwargs)
+            outcome = "done"
+        except Exception:
+            result["error"] = traceback.format_exc()
+            outcome = "failed"
+            logger.error("Job %s failed:\n%s", job["name"], result["error"])
+
+        stop.set()
+        beat.join()
+
+        _write_json(os.path.join(queue_path, outcome, job["name"]+".json"), result)
+        try:
+            os.remove(running_file)
+        except FileNotFoundError:
+            logger.warning("Job %s was requeued while running; it may run again", job["name"])
+        logger.info("Job %s is %s", job["name"], outcome)
+
+def requeue(queue_path, timeout=600):
+    """Move running jobs whose heartbeat is older than `timeout` seconds back to pending."""
+
+    now = time.time()
+    for fname in os.listdir(os.path.join(queue_path, "running")):
+        fpath = os.path.join(queue_path, "running", fname)
+        try:
+            if now - os.path.getmtime(fpath) < timeout:
+                continue
+            os.rename(fpath, os.path.join(queue_path, "pending", _job_name(fname)+".json"))
+        except FileNotFoundError:
+            continue
+        logger.warning("Requeued stale job %s", fname)
+
+def status(queue_path):
+    """Get the job names in each subfolder of a queue."""
+
+    return {sub: sorted([_job_name(f) for f in os.listdir(os.path.join(queue_path, sub))
+                         if f.endswith(".json")]) for sub in subfolders}
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+
+    # messages of run.py go to the file log of this script, too
+    run.logger.addHandler(fh)
+
+    # CMD argument parser
+    parser = argparse.ArgumentParser(
+        description="A work queue on a shared filesystem for running cases.")
+
+    parser.add_argument(
+        'command', type=str, choices=["enqueue", "worker", "requeue", "status"],
+        help='enqueue all cases, run a worker, requeue stale jobs, or show the queue')
+
+    parser.add_argument(
+        '--queue', dest='queue', type=str, default="queue",
+        help='the queue folder on the shared filesystem')
+
+    parser.add_argument(
+        '--nthreads', dest='nthreads', type=int, default=None,
+        help='OpenMP threads of each job run by a worker')
+
+    parser.add_argument(
+        '--local', dest='local', type=int, default=1,
+        help='number of worker processes started on this host')
+
+    parser.add_argument(
+        '--wait', dest='wait', action="store_true",
+        help='keep waiting for new jobs when the queue is empty')
+
+    parser.add_argument(
+        '--timeout', dest='timeout', type=float, default=600,
+        help='seconds without heartbeat after which a running job is requeued')
+
+    parser.add_argument(
+        '--cachedir', dest='cachedir', type=str, default=None,
+        help='keep a copy of finished outputs in this folder (default: no cache)')
+
+    args = parser.parse_args()
+
+    # paths
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    claw_path = os.path.join(repo_path, "src", "clawpack-v5.5.0")
+
+    # add environment variables
+    os.environ["CLAW"] = claw_path
+
+    # add clawpack python package search path
+    if claw_path != sys.path[0]:
+        sys.path.insert(0, claw_path)
+
+    queue_path = os.path.abspath(args.queue)
+
+    if args.command == "enqueue":
+        enqueue(queue_path, run.get_all_jobs())
+    elif args.command == "worker":
+        workers = [
+            multiprocessing.Process(
+                target=work, args=(queue_path, args.nthreads, args.wait),
+                kwargs={"cachedir": args.cachedir})
+            for _ in range(args.local)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    elif args.command == "requeue":
+        requeue(queue_path, args.timeout)
+    else:
+        for sub, names in status(queue_path).items():
+            print("{}: {}".format(sub, ", ".join(names) if names else "-"))